@@ -0,0 +1,148 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import repo as repo
+import export
+import instrument
+import tiling
+from fixture import ColorMapChoice, load_src_img
+from matcher import get_matcher
+from main import config
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+# per-process state, filled once by _init_worker
+_palette = None
+_matcher = None
+
+def _init_worker(csv_file_path, target_width=None, target_height=None):
+    global _palette, _matcher
+    # a forked worker starts with a copy of the parent's numbers, which the parent reports itself
+    instrument.reset()
+    config.TARGET_WIDTH, config.TARGET_HEIGHT = target_width, target_height
+    _palette = repo.prepare_repository(csv_file_path)
+    _matcher = get_matcher(_palette)
+
+def _warm_caches(csv_file_path):
+    # builds the palette, LUT and dither grid files without opening the match store, whose sqlite
+    # connection must not be carried across fork() into the workers
+    palette = repo.prepare_repository(csv_file_path)
+    candidates = palette.candidates(config.AVAIALABLE_ONLY)
+    if config.LUT:
+        import lut
+        lut.load_lut(palette, config.K, config.AVAIALABLE_ONLY, bits=config.LUT_BITS, refine=config.LUT_REFINE,
+                     cache_dir=config.CACHE_DIR, metric=config.METRIC)
+    if config.DITHER and not config.MAX_COLORS:
+        # a reduced palette is picked per image, so only the full candidate set can be built ahead
+        import dither
+        dither.load_grid(palette, candidates, config.METRIC, config.CACHE_DIR)
+
+def convert_image(src_img_path, out_dir, cell_size, sheets=False, tiles=False, tile_jobs=1) -> dict:
+    if tiles:
+        return convert_tiles(src_img_path, out_dir, cell_size, sheets, tile_jobs)
+    image_fixture = load_src_img(_palette, src_img_path, _matcher)
+    map_choice = ColorMapChoice(image_fixture)
+    stem = os.path.join(out_dir, os.path.splitext(os.path.basename(src_img_path))[0])
+    export.render_pattern(image_fixture, map_choice, cell_size).save(stem + '.pattern.png')
+    if sheets:
+        export.save_pdf(stem + '.sheets.pdf', image_fixture, map_choice, cell_size, config.PEGBOARD_SIZE)
+    with open(stem + '.grid.json', 'w') as f:
+        json.dump(export.code_grid(image_fixture, map_choice), f)
+    bom = export.bill_of_materials(image_fixture, map_choice)
+    with open(stem + '.bom.json', 'w') as f:
+        json.dump(bom, f, indent=2)
+    return {'width': image_fixture.width, 'height': image_fixture.height, 'colors': len(bom)}
+
+def _convert_job(*args) -> dict:
+    result = convert_image(*args)
+    if instrument.ENABLED:
+        # hand this task's share to the parent; resetting keeps the next task from resending it
+        result['profile'] = instrument.summary()
+        instrument.reset()
+    return result
+
+def convert_tiles(src_img_path, out_dir, cell_size, sheets=False, jobs=1) -> dict:
+    tiles = tiling.load_tiles(_palette, src_img_path, config.PEGBOARD_SIZE, _matcher, jobs)
+    stem = os.path.join(out_dir, os.path.splitext(os.path.basename(src_img_path))[0])
+    os.makedirs(stem + '.tiles', exist_ok=True)
+    for tile in tiles:
+        tile_stem = os.path.join(stem + '.tiles', tile.name)
+        map_choice = ColorMapChoice(tile.image_fixture)
+        export.render_pattern(tile.image_fixture, map_choice, cell_size, grid=True, codes=True).save(tile_stem + '.pattern.png')
+        if sheets:
+            export.save_pdf(tile_stem + '.sheets.pdf', tile.image_fixture, map_choice, cell_size, config.PEGBOARD_SIZE)
+        with open(tile_stem + '.grid.json', 'w') as f:
+            json.dump(export.code_grid(tile.image_fixture, map_choice), f)
+    per_tile, total = tiling.tile_bills_of_materials(tiles)
+    with open(stem + '.tiles.json', 'w') as f:
+        json.dump(per_tile, f, indent=2)
+    with open(stem + '.bom.json', 'w') as f:
+        json.dump(total, f, indent=2)
+    return {'width': tiles[-1].x0 + tiles[-1].image_fixture.width, 'height': tiles[-1].y0 + tiles[-1].image_fixture.height,
+            'colors': len(total), 'tiles': len(tiles)}
+
+def collect_images(sources) -> list[str]:
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(os.path.join(source, name) for name in os.listdir(source)
+                                if name.lower().endswith(IMAGE_EXTENSIONS)))
+        else:
+            paths.extend(sorted(glob.glob(source)))
+    return list(dict.fromkeys(paths))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert images to bead patterns without the GUI.")
+    parser.add_argument('sources', nargs='+', help="image files, directories or glob patterns")
+    parser.add_argument('-o', '--out-dir', default='out')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--cell-size', type=int, default=config.CELL_SIZE)
+    parser.add_argument('--palette', default='colors.csv')
+    parser.add_argument('--sheets', action='store_true', help="also write printable per-pegboard PDF sheets")
+    parser.add_argument('--width', type=int, default=config.TARGET_WIDTH, help="resample to this many beads across")
+    parser.add_argument('--height', type=int, default=config.TARGET_HEIGHT, help="resample to this many beads down")
+    parser.add_argument('--tiles', action='store_true',
+                        help="split into pegboards that are matched and exported one by one, with per-board BOMs")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    paths = collect_images(args.sources)
+    if not paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # warm the on-disk caches once so workers only have to load them
+    _warm_caches(args.palette)
+    worker_args = (args.palette, args.width, args.height)
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=worker_args) as pool:
+        # cores left over by a short batch go to per-tile threads, unless TILE_JOBS fixes the count
+        tile_jobs = config.TILE_JOBS or max(args.jobs // len(paths), 1)
+        futures = {pool.submit(_convert_job, path, args.out_dir, args.cell_size, args.sheets, args.tiles, tile_jobs): path
+                   for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(paths)}] {path}: failed: {e}", file=sys.stderr)
+                continue
+            instrument.merge(result.pop('profile', {}))
+            tiles = f", {result['tiles']} boards" if 'tiles' in result else ''
+            print(f"[{done}/{len(paths)}] {path}: {result['width']}x{result['height']}, {result['colors']} bead colors{tiles}",
+                  file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    instrument.start()
+    try:
+        sys.exit(main())
+    finally:
+        instrument.report()
@@ -0,0 +1,282 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import numpy as np
+from PIL import Image
+import repo as repo
+import color as clr
+from fixture import ColorMapChoice, load_src_img, pack_rgb
+from matcher import get_matcher
+from main import config
+
+SIZES = (32, 128, 512, 2048)
+PALETTE_SCALES = (1, 4, 16)
+# larger boards only repeat the raster canvas path at a bigger size
+MAX_CANVAS_SIZE = 512
+HEX_TARGETS = 1000
+MATCH_TARGETS = 200
+# a case that is this slow is not repeated
+SLOW_CASE_SECONDS = 5.0
+SEED = 1234
+
+def random_image(size: int) -> np.ndarray:
+    return np.random.default_rng(SEED).integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+def gradient_image(size: int) -> np.ndarray:
+    ramp = np.linspace(0, 255, size)
+    rgb = np.stack([np.broadcast_to(ramp[None, :], (size, size)), np.broadcast_to(ramp[:, None], (size, size)),
+                    np.broadcast_to(255 - ramp[None, :], (size, size))], axis=-1)
+    return np.rint(rgb).astype(np.uint8)
+
+PATTERNS = {
+    'random': random_image,
+    'gradient': gradient_image,
+}
+
+def scaled_palette_csv(src_csv, scale: int, out_dir) -> str:
+    # the original rows plus (scale - 1) jittered copies of each
+    with open(src_csv, newline='') as f:
+        rows = list(csv.DictReader(f))
+    rng = np.random.default_rng(SEED)
+    out_rows = []
+    for copy in range(scale):
+        for row in rows:
+            if copy:
+                rgb = np.clip(np.array(clr.hex_to_rgb(row['hex'])) + rng.normal(0, 8, 3), 0, 255)
+                row = dict(row, hex=clr.rgb_to_hex(tuple(int(round(c)) for c in rgb)),
+                           coco=f"{row['coco']}.{copy}", mard=f"{row['mard']}.{copy}")
+            out_rows.append(row)
+    path = os.path.join(out_dir, f"palette-x{scale}.csv")
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['hex', 'coco', 'mard', 'available'])
+        writer.writeheader()
+        writer.writerows(out_rows)
+    return path
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+        if times[-1] > SLOW_CASE_SECONDS:
+            break
+    # peak memory comes from one extra run; tracemalloc would skew the timed ones
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'mean': sum(times) / len(times), 'runs': len(times), 'peak_bytes': peak}
+
+class _StubPhoto:
+    def __init__(self, image=None, size=None, **kwargs):
+        self.image = image
+
+def canvas_backend():
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+        root.withdraw()
+        return root, 'tk'
+    except tk.TclError:
+        pass
+    import gui
+
+    # no display: a canvas that keeps its items in a dict. The MRO puts it under
+    # BoardCanvas, so the gui classes' own code runs unchanged on top of it.
+    class _StubCanvas(tk.Canvas):
+        def __init__(self, root, **kwargs):
+            self.items = {}
+            self.tk = types.SimpleNamespace(call=lambda *args: None)
+
+        def _create(self, *args, **kwargs):
+            self.items[len(self.items) + 1] = kwargs
+            return len(self.items)
+        create_rectangle = create_text = create_image = create_line = _create
+
+        def itemconfig(self, tag_or_id, **kwargs):
+            pass
+
+        def coords(self, tag_or_id, *args):
+            pass
+
+        def delete(self, *tags):
+            pass
+
+        def bind(self, sequence=None, func=None, add=None):
+            pass
+
+        def canvasx(self, x, gridspacing=None):
+            return x
+        canvasy = canvasx
+
+        def winfo_width(self):
+            return config.RASTER_VIEWPORT
+        winfo_height = winfo_width
+
+    gui.RltImgCanvas = type('RltImgCanvas', (gui.RltImgCanvas, _StubCanvas), {})
+    gui.ImageTk = types.SimpleNamespace(PhotoImage=_StubPhoto)
+    return None, 'stub'
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args) -> dict:
+    results = {}
+    # repeats would otherwise be served from the match cache instead of timing the matcher
+    config.MATCH_CACHE = args.match_cache
+
+    def record(name, result):
+        results[name] = result
+        print(f"{name:48s} {result['seconds'] * 1000:10.2f} ms  {result['peak_bytes'] / 2 ** 20:8.1f} MiB",
+              file=sys.stderr)
+
+    root, backend = canvas_backend()
+    import gui
+
+    targets = clr.hexes_to_lab([f"{value:06x}" for value in pack_rgb(gradient_image(16)).ravel()[:MATCH_TARGETS].tolist()])
+    with tempfile.TemporaryDirectory() as work_dir:
+        # a fresh cache dir keeps a LUT or match store left by earlier runs out of the timings
+        config.CACHE_DIR = work_dir
+        palettes = {}
+        for scale in args.scales:
+            csv_path = scaled_palette_csv(args.palette, scale, work_dir)
+
+            def drop_compiled(csv_path=csv_path):
+                if os.path.exists(repo.compiled_path_for(csv_path)):
+                    os.remove(repo.compiled_path_for(csv_path))
+            record(f"prepare_repository/cold/x{scale}",
+                   measure(lambda _: repo.prepare_repository(csv_path), args.repeat, drop_compiled))
+            record(f"prepare_repository/warm/x{scale}",
+                   measure(lambda _: repo.prepare_repository(csv_path), args.repeat))
+            palettes[scale] = repo.prepare_repository(csv_path)
+
+            hexes = palettes[scale].hex[:HEX_TARGETS].tolist()
+            record(f"hex_to_lab/x{scale}/n{len(hexes)}",
+                   measure(lambda _: [clr.hex_to_lab(h) for h in hexes], args.repeat))
+
+            record(f"find_closest_colors/x{scale}/n{len(targets)}",
+                   measure(lambda _: [clr.find_closest_colors(palettes[scale], t, config.K, config.AVAIALABLE_ONLY,
+                                                              config.METRIC) for t in targets], args.repeat))
+
+        # image cases match against the smallest palette; palette scaling is covered above
+        palette = palettes[min(args.scales)]
+
+        def fresh_cache_dir():
+            config.CACHE_DIR = tempfile.mkdtemp(dir=work_dir)
+        # the one-off LUT build is its own case, so the image cases below only time matching
+        record(f"get_matcher/cold/x{min(args.scales)}",
+               measure(lambda _: get_matcher(palette), args.repeat, fresh_cache_dir))
+        config.CACHE_DIR = work_dir
+        matcher = get_matcher(palette)
+        for pattern, make in PATTERNS.items():
+            for size in args.sizes:
+                path = os.path.join(work_dir, f"{pattern}-{size}.png")
+                Image.fromarray(make(size), 'RGB').save(path)
+                record(f"load_src_img/{pattern}/{size}",
+                       measure(lambda _: load_src_img(palette, path, matcher), args.repeat))
+                if size > MAX_CANVAS_SIZE:
+                    continue
+                image_fixture = load_src_img(palette, path, matcher)
+                choice = ColorMapChoice(image_fixture)
+                canvas = gui.RltImgCanvas(root, image_fixture=image_fixture)
+                record(f"RltImgCanvas.update/{pattern}/{size}",
+                       measure(lambda _: canvas.update(choice, True, True), args.repeat))
+                if backend == 'tk':
+                    canvas.destroy()
+    if root is not None:
+        root.destroy()
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'canvas': backend,
+            'metric': config.METRIC,
+            'lut': config.LUT,
+            'match_cache': config.MATCH_CACHE,
+            'k': config.K,
+        },
+        'results': results,
+    }
+
+def compare(base: dict, head: dict, threshold: float, memory_threshold: float) -> list[str]:
+    regressions = []
+    print(f"{'case':48s} {'base ms':>10s} {'head ms':>10s} {'time':>8s} {'memory':>8s}")
+    for name, new in head['results'].items():
+        old = base['results'].get(name)
+        if old is None:
+            print(f"{name:48s} {'-':>10s} {new['seconds'] * 1000:10.2f}      new")
+            continue
+        time_change = new['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        memory_change = new['peak_bytes'] / old['peak_bytes'] - 1 if old['peak_bytes'] else 0.0
+        flags = []
+        if time_change > threshold:
+            flags.append('SLOWER')
+        if memory_change > memory_threshold:
+            flags.append('MORE MEMORY')
+        if flags:
+            regressions.append(name)
+        print(f"{name:48s} {old['seconds'] * 1000:10.2f} {new['seconds'] * 1000:10.2f} {time_change:+8.1%} "
+              f"{memory_change:+8.1%}  {' '.join(flags)}")
+    for name in base['results'].keys() - head['results'].keys():
+        print(f"{name:48s} missing from head")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the conversion hot paths.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the suite and write JSON results")
+    run_parser.add_argument('-o', '--output', help="results file (default: stdout)")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    run_parser.add_argument('--scales', type=int, nargs='+', default=PALETTE_SCALES)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--palette', default='colors.csv')
+    run_parser.add_argument('--match-cache', action='store_true', help="time with the match cache enabled")
+    compare_parser = commands.add_parser('compare', help="report regressions between two result files")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown, 0.10 = 10%%")
+    compare_parser.add_argument('--memory-threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = json.dumps(run(args), indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            print(report)
+        return 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    regressions = compare(base, head, args.threshold, args.memory_threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above threshold", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
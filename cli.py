@@ -1,11 +1,23 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import argparse
+import csv
+import json
+import re
+import sys
 import repo as repo
 import color as clr
+import instrument
 from model import ColorEntryMatch
-from main import config
+from matcher import get_matcher
+
+HEX_PATTERN = re.compile(r'#?[0-9a-fA-F]{6}')
+# inputs matched per vectorized call in streaming mode
+STREAM_BATCH = 4096
+CSV_FIELDS = ['input', 'rank', 'hex', 'coco', 'mard', 'available', 'distance', 'error']
 
 def display_color_swatches(target_hex_str: str, closest_colors: list[ColorEntryMatch]):
+    # matplotlib is slow to import, so only pay for it when a swatch is actually shown
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
     fig, ax = plt.subplots()
     swatch_width = 1  # Width of each color swatch
     interval = 0.1    # Interval between swatches
@@ -29,10 +41,73 @@ def display_color_swatches(target_hex_str: str, closest_colors: list[ColorEntryM
     plt.axis('off')
     plt.show()
 
-def main():
-    csv_file_path = 'colors.csv'
-    repository = repo.prepare_repository(csv_file_path)
-   
+def read_hex_values(stream, column=None):
+    # one hex per line, or CSV rows; a header row naming the column (default "hex") selects it
+    rows = csv.reader(stream)
+    position = 0
+    for line_no, row in enumerate(rows):
+        if not row:
+            continue
+        if line_no == 0:
+            names = [cell.strip().lower() for cell in row]
+            wanted = (column or 'hex').lower()
+            if wanted in names:
+                position = names.index(wanted)
+                continue
+            if column is not None:
+                raise ValueError(f"Column {column!r} not found in header {row}")
+        yield row[position].strip() if position < len(row) else ''
+
+def batched(values, size: int):
+    batch = []
+    for value in values:
+        batch.append(value)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def match_batch(matcher, hex_strs: list[str]):
+    valid = [i for i, hex_str in enumerate(hex_strs) if HEX_PATTERN.fullmatch(hex_str)]
+    if not valid:
+        return valid, None, None
+    match_idx, match_dist = matcher.match(clr.hexes_to_rgb([hex_strs[i] for i in valid]))
+    return valid, match_idx, match_dist
+
+def match_records(repository, match_idx, match_dist) -> list[list[dict]]:
+    # column lookups for the whole batch instead of a ColorEntry per match
+    hexes, cocos, mards = (column[match_idx].tolist() for column in (repository.hex, repository.coco, repository.mard))
+    available = repository.available[match_idx].tolist()
+    distances = match_dist.round(4).tolist()
+    return [[{'hex': hexes[r][j], 'coco': cocos[r][j], 'mard': mards[r][j], 'available': available[r][j],
+              'distance': distances[r][j]} for j in range(len(hexes[r]))] for r in range(len(hexes))]
+
+def stream(repository, matcher, source, out, output_format='ndjson', column=None, batch_size=STREAM_BATCH):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS) if output_format == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for hex_strs in batched(read_hex_values(source, column), batch_size):
+        if matcher is None:
+            # a short first batch is the whole input, which may be too little to pay for a lookup table build
+            matcher = get_matcher(repository, len(hex_strs) if len(hex_strs) < batch_size else None)
+        valid, match_idx, match_dist = match_batch(matcher, hex_strs)
+        results = [None] * len(hex_strs)
+        if valid:
+            for i, records in zip(valid, match_records(repository, match_idx, match_dist)):
+                results[i] = records
+        for hex_str, records in zip(hex_strs, results):
+            if writer:
+                if records is None:
+                    writer.writerow({'input': hex_str, 'error': 'invalid hex color'})
+                for rank, record in enumerate(records or [], 1):
+                    writer.writerow({'input': hex_str, 'rank': rank, **record})
+            elif records is None:
+                out.write(json.dumps({'input': hex_str, 'error': 'invalid hex color'}) + '\n')
+            else:
+                out.write(json.dumps({'input': hex_str, 'matches': records}) + '\n')
+
+def interactive(repository, matcher, swatches=True):
     while True:
         target_hex_str = input("Enter a hex color (or type 'exit' to quit): ").strip()
         if target_hex_str.lower() in ['exit', 'quit']:
@@ -42,9 +117,8 @@ def main():
             print("Invalid hex color format. Please enter a 6-digit hex color.")
             continue
         
-        target_hex = clr.hex_to_lab(target_hex_str)
-        closest_colors = clr.find_closest_colors(repository, target_hex,
-                                                  k=config.K, available_only=config.AVAILABLE_ONLY) 
+        match_idx, match_dist = matcher.match(clr.hexes_to_rgb([target_hex_str]))
+        closest_colors = clr.to_matches(repository, match_idx[0], match_dist[0])
 
         print()
         print(" === BEST MATCH FOR COLOR " + target_hex_str.upper() + " === ")
@@ -52,4 +126,48 @@ def main():
             print(f"{cem.color.hex} {cem.color.coco}  - Distance: {cem.distance}")
         print()
 
-        display_color_swatches(target_hex_str, closest_colors)
+        if swatches:
+            display_color_swatches(target_hex_str, closest_colors)
+
+    stats = getattr(matcher, 'stats', None)
+    if stats:
+        print(f"Match cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Find the closest bead colors for hex colors.")
+    parser.add_argument('input', nargs='?',
+                        help="file of hex colors or CSV rows to match in bulk; '-' reads stdin. "
+                             "Without it the prompt asks for one color at a time.")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson', help="bulk output format")
+    parser.add_argument('--column', help="CSV column holding the hex colors (default: 'hex' if present, else the first)")
+    parser.add_argument('--no-swatches', action='store_true', help="don't open a swatch window per prompt query")
+    parser.add_argument('--palette', default='colors.csv')
+    args = parser.parse_args(argv)
+
+    repository = repo.prepare_repository(args.palette)
+
+    if args.input is None:
+        # one color per prompt is never worth a cold lookup table build
+        interactive(repository, get_matcher(repository, expected_colors=1), swatches=not args.no_swatches)
+        return 0
+    try:
+        if args.input == '-':
+            stream(repository, None, sys.stdin, sys.stdout, args.format, args.column)
+        else:
+            with open(args.input, newline='') as source:
+                stream(repository, None, source, sys.stdout, args.format, args.column)
+    except BrokenPipeError:
+        # piping into head and the like closes stdout early
+        sys.stderr.close()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    # main.py reports around cli.main() itself, so only the direct entry point does it here
+    instrument.start()
+    try:
+        sys.exit(main())
+    finally:
+        instrument.report()
@@ -1,14 +1,8 @@
-from colormath.color_objects import sRGBColor, LabColor
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie1976
-from model import ColorEntry, ColorEntryMatch
-
-# Patch numpy to allow asscalar() on numpy.float64
 import numpy
-def patch_asscalar(a):
-    return a.item()
-setattr(numpy, "asscalar", patch_asscalar)
-# End patch
+import colorspace
+import instrument
+from metrics import get_metric
+from model import ColorEntryMatch, Palette
 
 def hex_to_rgb(hex_str) -> tuple[int, int, int]:
     hex_str = hex_str.lstrip('#')
@@ -17,31 +11,73 @@ def hex_to_rgb(hex_str) -> tuple[int, int, int]:
 def rgb_to_hex(rgb) -> str:
     return "#{:02x}{:02x}{:02x}".format(*rgb)
 
-def hex_to_srgb(hex_str: str) -> sRGBColor:
-    hex_str = hex_str.lstrip('#')
-    rgb_tuple = tuple(int(hex_str[i:i+2], 16) for i in (0, 2, 4))
-    return sRGBColor(*rgb_tuple, is_upscaled=True)
+def hexes_to_rgb(hex_strs) -> numpy.ndarray:
+    packed = bytes.fromhex(''.join(hex_str.lstrip('#') for hex_str in hex_strs))
+    return numpy.frombuffer(packed, dtype=numpy.uint8).reshape(-1, 3)
 
-def srgb_to_lab(srgb_color: sRGBColor) -> LabColor:
-    return convert_color(srgb_color, LabColor)
+def hex_to_lab(hex_str: str) -> numpy.ndarray:
+    return colorspace.rgb_to_lab(hexes_to_rgb([hex_str]))[0]
 
-def hex_to_lab(hex_str: str) -> LabColor:
-    return srgb_to_lab(hex_to_srgb(hex_str))
+def hexes_to_lab(hex_strs) -> numpy.ndarray:
+    with instrument.timer('lab'):
+        return colorspace.rgb_to_lab(hexes_to_rgb(hex_strs))
 
 def calculate_luminance(hex_str: str) -> float:
     r, g, b = hex_to_rgb(hex_str)
     return (0.299 * r + 0.587 * g + 0.114 * b) / 255
 
-def color_distance(lab_color1: LabColor, lab_color2: LabColor) -> float:
-    return delta_e_cie1976(lab_color1, lab_color2)
-
-def find_closest_colors(repository: list[ColorEntry], target_lab_color: LabColor, 
-                        k=5, available_only=False) -> list[ColorEntryMatch]:
-    rlt = []
-    for colorentry in repository:
-        if available_only and not colorentry.available:
-            continue
-        dist = color_distance(colorentry.lab_color, target_lab_color)
-        rlt.append(ColorEntryMatch(colorentry, dist))
-    rlt.sort(key=lambda cem:cem.distance)
-    return rlt[:k]
+def color_distance(lab_color1, lab_color2, metric='CIE76') -> float:
+    return float(get_metric(metric)(numpy.asarray(lab_color1, dtype=numpy.float64),
+                                    numpy.asarray(lab_color2, dtype=numpy.float64)))
+
+# target x palette cells evaluated per chunk; bounds the temporaries of the heavier metrics
+MATCH_CHUNK_CELLS = 1 << 20
+
+def distance_matrix(targets: numpy.ndarray, cand_lab: numpy.ndarray, metric='CIE76') -> numpy.ndarray:
+    if metric.upper() == 'CIE76':
+        # euclidean distance via |a|^2 + |b|^2 - 2ab, cheaper than broadcasting the difference
+        d2 = (targets ** 2).sum(axis=1)[:, None] + (cand_lab ** 2).sum(axis=1)[None, :] - 2 * targets @ cand_lab.T
+        return numpy.sqrt(numpy.maximum(d2, 0, out=d2), out=d2)
+    return get_metric(metric)(targets[:, None, :], cand_lab[None, :, :])
+
+def distance_table(palette: Palette, target_labs, candidates: numpy.ndarray, metric='CIE76') -> numpy.ndarray:
+    cand_lab = palette.lab[candidates]
+    targets = numpy.asarray(target_labs, dtype=numpy.float64).reshape(-1, 3)
+    chunk_size = max(MATCH_CHUNK_CELLS // max(len(candidates), 1), 1)
+    instrument.count('distance_evaluations', len(targets) * len(candidates))
+    return numpy.concatenate([distance_matrix(targets[start:start + chunk_size], cand_lab, metric)
+                              for start in range(0, len(targets), chunk_size)] or [numpy.empty((0, len(candidates)))])
+
+def find_closest_batch(palette: Palette, target_labs, k=5, available_only=False,
+                       metric='CIE76', candidates=None) -> tuple[numpy.ndarray, numpy.ndarray]:
+    if candidates is None:
+        candidates = palette.candidates(available_only)
+    cand_lab = palette.lab[candidates]
+    targets = numpy.asarray(target_labs, dtype=numpy.float64).reshape(-1, 3)
+    k = min(k, len(candidates))
+    instrument.count('distance_evaluations', len(targets) * len(candidates))
+    idx = numpy.empty((len(targets), k), dtype=numpy.intp)
+    dist = numpy.empty((len(targets), k), dtype=numpy.float64)
+    chunk_size = max(MATCH_CHUNK_CELLS // max(len(candidates), 1), 1)
+    with instrument.timer('distances'):
+        for start in range(0, len(targets), chunk_size):
+            chunk = targets[start:start + chunk_size]
+            d = distance_matrix(chunk, cand_lab, metric)
+            if k < len(candidates):
+                part = numpy.argpartition(d, k - 1, axis=1)[:, :k]
+            else:
+                part = numpy.broadcast_to(numpy.arange(k), (len(chunk), k))
+            part_d = numpy.take_along_axis(d, part, axis=1)
+            order = numpy.lexsort((part, part_d), axis=-1)
+            idx[start:start + len(chunk)] = numpy.take_along_axis(part, order, axis=1)
+            dist[start:start + len(chunk)] = numpy.take_along_axis(part_d, order, axis=1)
+    return candidates[idx], dist
+
+def to_matches(palette: Palette, idx_row, dist_row) -> list[ColorEntryMatch]:
+    return [ColorEntryMatch(palette[i], float(d)) for i, d in zip(idx_row, dist_row)]
+
+def find_closest_colors(repository: Palette, target_lab_color, 
+                        k=5, available_only=False, metric='CIE76') -> list[ColorEntryMatch]:
+    idx, dist = find_closest_batch(repository, [target_lab_color],
+                                   k=k, available_only=available_only, metric=metric)
+    return to_matches(repository, idx[0], dist[0])
@@ -0,0 +1,40 @@
+import numpy as np
+
+# sRGB (D65) -> CIE XYZ, same constants colormath uses
+SRGB_TO_XYZ = np.array([
+    [0.412424, 0.357579, 0.180464],
+    [0.212656, 0.715158, 0.0721856],
+    [0.0193324, 0.119193, 0.950444],
+])
+D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+CIE_E = 216 / 24389
+# linear-segment slope as colormath rounds it (exact value is 24389 / 27 / 116)
+CIE_SLOPE = 7.787
+
+def srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.maximum(values, 0) ** (1 / 2.4) - 0.055)
+
+# every 8-bit channel value linearized once, so uint8 input is a table lookup
+_LINEAR_TABLE = srgb_to_linear(np.arange(256) / 255)
+
+def rgb_to_xyz(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.asarray(rgb)
+    linear = _LINEAR_TABLE[rgb] if rgb.dtype == np.uint8 else srgb_to_linear(rgb / 255)
+    return linear @ SRGB_TO_XYZ.T
+
+def xyz_to_lab(xyz: np.ndarray) -> np.ndarray:
+    t = np.asarray(xyz, dtype=np.float64) / D65_WHITE
+    f = np.where(t > CIE_E, np.cbrt(t), CIE_SLOPE * t + 16 / 116)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    return xyz_to_lab(rgb_to_xyz(rgb))
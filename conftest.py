@@ -0,0 +1,7 @@
+import os
+import pytest
+import repo
+
+@pytest.fixture(scope='module')
+def palette():
+    return repo.prepare_repository(os.path.join(os.path.dirname(__file__), 'colors.csv'))
@@ -0,0 +1,266 @@
+from functools import lru_cache
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import zipfile
+import numpy as np
+from color import find_closest_batch
+from colorspace import rgb_to_lab
+from fixture import ImageFixture
+from metrics import get_metric
+from model import Palette
+
+# (dx, dy, weight); dx points along the scan direction
+KERNELS = {
+    'floyd-steinberg': ((1, 0, 7 / 16), (-1, 1, 3 / 16), (0, 1, 5 / 16), (1, 1, 1 / 16)),
+    'atkinson': ((1, 0, 1 / 8), (2, 0, 1 / 8), (-1, 1, 1 / 8), (0, 1, 1 / 8), (1, 1, 1 / 8), (0, 2, 1 / 8)),
+}
+
+# nearest-bead lookup grid over the Lab box of the sRGB gamut (lo, hi, step);
+# diffused values are clamped into it
+GRID_L = (0.0, 100.0, 2.5)
+GRID_A = (-90.0, 100.0, 5.0)
+GRID_B = (-110.0, 95.0, 5.0)
+GRID_SHORTLIST = 48
+# cell corners bound how far a cell reaches only approximately under CIE94/CIEDE2000
+GRID_RADIUS_SAFETY = 2.0
+GRID_BOUND_UNIT = 0.25
+
+# the corners of a cell around its center, also its octants in the order nearest() numbers them:
+# (l above center) * 4 + (a above center) * 2 + (b above center)
+OCTANTS = np.array([(sl, sa, sb) for sl in (-1, 1) for sa in (-1, 1) for sb in (-1, 1)])
+
+GRID_VERSION = 1
+
+class NearestGrid:
+    # cells: a bead >= 0, or -1 - the first of the cell's 8 entries in octants;
+    # octants: a bead >= 0, or -1 - a run, whose beads and bounds are beads/least[offsets[run]:offsets[run + 1]]
+    def __init__(self, palette: Palette, metric: str, cells: np.ndarray, octants: np.ndarray,
+                 offsets: np.ndarray, beads: np.ndarray, least: np.ndarray):
+        self.arrays = {'cells': cells, 'octants': octants, 'offsets': offsets, 'beads': beads, 'least': least}
+        # memoryviews index one element at a time as plain ints, which the per-pixel scan needs
+        self.cells, self.octants, self.offsets, self.beads, self.least = (
+            memoryview(np.ascontiguousarray(array)) for array in (cells, octants, offsets, beads, least))
+        self.n_a, self.n_b = len(_axis(GRID_A)), len(_axis(GRID_B))
+        self.distance = get_metric(metric, point=True)
+        self.lab = palette.lab.tolist()
+
+    def nearest(self, l, a, b) -> int:
+        li = int((l - GRID_L[0]) / GRID_L[2] + 0.5)
+        ai = int((a - GRID_A[0]) / GRID_A[2] + 0.5)
+        bi = int((b - GRID_B[0]) / GRID_B[2] + 0.5)
+        entry = self.cells[(li * self.n_a + ai) * self.n_b + bi]
+        if entry >= 0:
+            return entry
+        entry = self.octants[-1 - entry + (l >= GRID_L[0] + li * GRID_L[2]) * 4
+                             + (a >= GRID_A[0] + ai * GRID_A[2]) * 2 + (b >= GRID_B[0] + bi * GRID_B[2])]
+        if entry >= 0:
+            return entry
+        beads, least = self.beads, self.least
+        best, best_dist, bound = -1, math.inf, math.inf
+        for j in range(self.offsets[-1 - entry], self.offsets[-entry]):
+            if least[j] > bound:
+                break
+            i = beads[j]
+            bead_l, bead_a, bead_b = self.lab[i]
+            d = self.distance(l, a, b, bead_l, bead_a, bead_b)
+            if d < best_dist:
+                best, best_dist, bound = i, d, d / GRID_BOUND_UNIT
+        return best
+
+def _axis(spec) -> np.ndarray:
+    lo, hi, step = spec
+    return np.arange(lo, hi + step / 2, step)
+
+def build_grid(palette: Palette, candidates: np.ndarray, metric: str) -> dict:
+    l_axis, a_axis, b_axis = _axis(GRID_L), _axis(GRID_A), _axis(GRID_B)
+    kernel = get_metric(metric)
+    centers = np.stack(np.meshgrid(l_axis, a_axis, b_axis, indexing='ij'), axis=-1).reshape(-1, 3)
+    half_steps = np.array([GRID_L[2], GRID_A[2], GRID_B[2]]) / 2
+    radius = kernel(centers[:, None, :], centers[:, None, :] + OCTANTS * half_steps).max(axis=1)
+    radius *= GRID_RADIUS_SAFETY
+    k = min(GRID_SHORTLIST, len(candidates))
+    idx, dist = find_closest_batch(palette, centers, k=k, metric=metric, candidates=candidates)
+    # a bead can be nearest somewhere in a cell only if it is within 2 * radius of the center's nearest
+    reach = (dist <= dist[:, :1] + 2 * radius[:, None]).sum(axis=1)
+    in_reach = {cell: idx[cell, :n] for cell, n in enumerate(reach.tolist()) if n > 1}
+    # where every shortlisted bead is in reach, beads past the shortlist may be too; rank all of them there
+    capped = np.flatnonzero(reach == k) if k < len(candidates) else []
+    if len(capped):
+        idx_all, dist_all = find_closest_batch(palette, centers[capped], k=len(candidates), metric=metric,
+                                               candidates=candidates)
+        for cell, row, row_dist in zip(capped.tolist(), idx_all, dist_all):
+            in_reach[cell] = row[row_dist <= row_dist[0] + 2 * radius[cell]]
+    # a cell with one bead in reach is just that bead; the rest are split into octants, which only have to
+    # rank their cell's beads
+    cells = idx[:, 0].astype(np.int32)
+    by_size = {}
+    for cell, beads in in_reach.items():
+        by_size.setdefault(len(beads), []).append(cell)
+    octants, runs, beads, least = [], [], [], []
+    n_octants = n_runs = 0
+    for group in by_size.values():
+        group = np.array(group)
+        # an octant spans half its cell, so half the cell's radius bounds it
+        group_octants, group_runs, group_beads, group_least = _split(
+            palette, kernel, centers[group], half_steps / 2, radius[group] / 2,
+            np.array([in_reach[cell] for cell in group.tolist()]), n_runs)
+        cells[group] = -1 - (n_octants + np.arange(len(group), dtype=np.int32) * len(OCTANTS))
+        n_octants += group_octants.size
+        n_runs += len(group_runs)
+        octants.append(group_octants.ravel())
+        runs.append(group_runs)
+        beads.append(group_beads)
+        least.append(group_least)
+    lengths = np.concatenate([np.zeros(1, dtype=np.int64), *runs])
+    return {'cells': cells,
+            'octants': np.concatenate([np.empty(0, dtype=np.int32), *octants]),
+            'offsets': np.cumsum(lengths),
+            'beads': np.concatenate([np.empty(0, dtype=np.uint16), *beads]),
+            'least': np.concatenate([np.empty(0, dtype=np.uint16), *least])}
+
+def _split(palette: Palette, kernel, centers: np.ndarray, offsets: np.ndarray, radius: np.ndarray,
+           beads: np.ndarray, first_run: int):
+    octant_centers = centers[:, None, None, :] + (OCTANTS * offsets)[None, :, None, :]
+    radius = np.broadcast_to(radius[:, None], (len(centers), len(OCTANTS)))
+    dist = kernel(octant_centers, palette.lab[beads][:, None, :, :])
+    order = np.argsort(dist, axis=2, kind='stable')
+    beads = np.take_along_axis(np.broadcast_to(beads[:, None, :], dist.shape), order, axis=2)
+    dist = np.take_along_axis(dist, order, axis=2)
+    reach = (dist <= dist[..., :1] + 2 * radius[..., None]).sum(axis=2)
+    # an octant is the beads that can be nearest somewhere in it, nearest to its center first, and the least
+    # distance each can have from a point in the octant, rounded down to whole GRID_BOUND_UNITs. Distances are
+    # never negative, so bounds below zero are stored as zero
+    least = np.floor((dist - radius[..., None]) / GRID_BOUND_UNIT).clip(0, np.iinfo(np.uint16).max)
+    single = reach == 1
+    in_run = (np.arange(dist.shape[2]) < reach[..., None]) & ~single[..., None]
+    run_ids = first_run + np.cumsum(~single.ravel()).reshape(single.shape) - 1
+    octants = np.where(single, beads[..., 0], -1 - run_ids).astype(np.int32)
+    return octants, reach[~single].astype(np.int64), beads[in_run].astype(np.uint16), least[in_run].astype(np.uint16)
+
+def grid_key(palette: Palette, candidates: np.ndarray, metric: str) -> str:
+    raw = (f"{GRID_VERSION}:{palette.fingerprint}:{metric.upper()}:{GRID_L}:{GRID_A}:{GRID_B}:{GRID_SHORTLIST}:"
+           f"{GRID_RADIUS_SAFETY}:{GRID_BOUND_UNIT}:").encode() + np.asarray(candidates, dtype='<i8').tobytes()
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+def load_grid(palette: Palette, candidates: np.ndarray, metric: str, cache_dir: str | None = None) -> NearestGrid:
+    path = os.path.join(cache_dir, f"grid-{grid_key(palette, candidates, metric)}.npz") if cache_dir else None
+    arrays = _load_grid_arrays(path) if path else None
+    if arrays is None:
+        arrays = build_grid(palette, candidates, metric)
+        if path:
+            _save_grid_arrays(path, arrays)
+    return NearestGrid(palette, metric, **arrays)
+
+def _load_grid_arrays(path) -> dict | None:
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return {name: npz[name] for name in _GRID_ARRAYS}
+    except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+        # a missing, truncated or damaged cache file is just a miss
+        return None
+
+def _save_grid_arrays(path, arrays: dict):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a temp file of our own, so processes saving the same grid at once don't interleave
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.grid.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except OSError:
+        # an unwritable cache dir rebuilds the grid in every process
+        pass
+
+_GRID_ARRAYS = ('cells', 'octants', 'offsets', 'beads', 'least')
+# lru_cache does not hold a lock while it computes a miss, so tile threads would each build the same grid
+_grid_lock = threading.Lock()
+
+@lru_cache(maxsize=2)
+def _cached_grid(palette: Palette, candidates: tuple, metric: str, cache_dir: str | None) -> NearestGrid:
+    return load_grid(palette, np.array(candidates, dtype=np.intp), metric, cache_dir)
+
+def _nearest_grid(palette: Palette, candidates: tuple, metric: str, cache_dir: str | None = None) -> NearestGrid:
+    with _grid_lock:
+        return _cached_grid(palette, candidates, metric, cache_dir)
+
+def dither_lab(palette: Palette, lab: np.ndarray, kernel='floyd-steinberg', serpentine=True,
+               available_only=False, metric='CIE76', candidates=None, cache_dir=None) -> np.ndarray:
+    if candidates is None:
+        candidates = palette.candidates(available_only)
+    grid = _nearest_grid(palette, tuple(candidates.tolist()), metric, cache_dir)
+    weights = KERNELS[kernel]
+    same_row = [(dx, w) for dx, dy, w in weights if dy == 0]
+    below = [(dx, dy, w) for dx, dy, w in weights if dy > 0]
+    height, width = lab.shape[:2]
+    work = np.array(lab, dtype=np.float64)
+    out = np.empty((height, width), dtype=np.intp)
+    (l_lo, l_hi, _), (a_lo, a_hi, _), (b_lo, b_hi, _) = GRID_L, GRID_A, GRID_B
+    for y in range(height):
+        reverse = serpentine and y % 2 == 1
+        sign = -1 if reverse else 1
+        xs = range(width - 1, -1, -1) if reverse else range(width)
+        row = work[y].tolist()
+        row_out = [0] * width
+        errors = [None] * width
+        # the in-row carry is inherently sequential, so it runs on plain floats
+        for x in xs:
+            l, a, b = row[x]
+            l = min(max(l, l_lo), l_hi)
+            a = min(max(a, a_lo), a_hi)
+            b = min(max(b, b_lo), b_hi)
+            i = grid.nearest(l, a, b)
+            row_out[x] = i
+            bead = grid.lab[i]
+            el, ea, eb = l - bead[0], a - bead[1], b - bead[2]
+            errors[x] = (el, ea, eb)
+            for dx, w in same_row:
+                nx = x + sign * dx
+                if 0 <= nx < width:
+                    target = row[nx]
+                    target[0] += el * w
+                    target[1] += ea * w
+                    target[2] += eb * w
+        out[y] = row_out
+        # spreading to the rows below is one shifted array add per kernel tap
+        row_errors = np.array(errors)
+        for dx, dy, w in below:
+            if y + dy >= height:
+                continue
+            shift = sign * dx
+            if shift > 0:
+                work[y + dy, shift:] += w * row_errors[:-shift]
+            elif shift < 0:
+                work[y + dy, :shift] += w * row_errors[-shift:]
+            else:
+                work[y + dy] += w * row_errors
+    return out
+
+def apply_dither(image_fixture: ImageFixture, kernel='floyd-steinberg', serpentine=True,
+                 available_only=False, metric='CIE76', candidates=None, cache_dir=None) -> ImageFixture:
+    palette = image_fixture.palette
+    src_lab = rgb_to_lab(image_fixture.src_rgb)
+    beads = dither_lab(palette, src_lab[image_fixture.index], kernel, serpentine, available_only, metric,
+                       candidates, cache_dir)
+    # every (source color, assigned bead) pair becomes its own source color, so the
+    # choice/canvas/export code keeps working on a plain per-source-color mapping
+    pairs = image_fixture.index.astype(np.int64) * len(palette) + beads
+    uniq_pairs, inverse = np.unique(pairs.ravel(), return_inverse=True)
+    src_of, bead_of = np.divmod(uniq_pairs, len(palette))
+    orig_idx = image_fixture.match_idx[src_of].astype(np.intp)
+    orig_dist = image_fixture.match_dist[src_of]
+    k = orig_idx.shape[1]
+    keep = np.argsort(orig_idx == bead_of[:, None], axis=1, kind='stable')[:, :k - 1]
+    match_idx = np.concatenate([bead_of[:, None], np.take_along_axis(orig_idx, keep, axis=1)], axis=1)
+    bead_dist = get_metric(metric)(src_lab[src_of], palette.lab[bead_of])
+    match_dist = np.concatenate([bead_dist[:, None], np.take_along_axis(orig_dist, keep, axis=1)], axis=1)
+    index = inverse.reshape(image_fixture.height, image_fixture.width)
+    index = index.astype(np.uint16 if len(uniq_pairs) <= 1 << 16 else np.uint32)
+    return ImageFixture(palette, image_fixture.src_rgb[src_of], index,
+                        match_idx.astype(image_fixture.match_idx.dtype), match_dist.astype(np.float32))
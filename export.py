@@ -0,0 +1,162 @@
+import os
+from xml.sax.saxutils import escape
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from fixture import ImageFixture, ColorMapChoice
+from model import Palette
+
+GRID_COLOR = (128, 128, 128)
+BOARD_COLOR = (0, 0, 0)
+# bead codes are only legible from this cell size up
+MIN_CODE_CELL_SIZE = 16
+PAGE_MARGIN = 40
+LEGEND_ROW = 28
+
+def mapped_rgb(image_fixture: ImageFixture, map_choice: ColorMapChoice) -> np.ndarray:
+    return image_fixture.palette.rgb[map_choice.mapped_grid()]
+
+def render_pattern(image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int,
+                   grid=False, codes=False) -> Image.Image:
+    return render_grid(image_fixture.palette, map_choice.mapped_grid(), cell_size, grid=grid, codes=codes)
+
+def render_grid(palette: Palette, mapped: np.ndarray, cell_size: int, grid=False, codes=False) -> Image.Image:
+    height, width = mapped.shape
+    # one pre-drawn tile per bead color in use, laid out with a single fancy index
+    used, local = np.unique(mapped, return_inverse=True)
+    tiles = np.ascontiguousarray(np.broadcast_to(palette.rgb[used][:, None, None, :], (len(used), cell_size, cell_size, 3)))
+    if codes and cell_size >= MIN_CODE_CELL_SIZE:
+        font = ImageFont.load_default()
+        text_fill = text_colors(palette)
+        for j, i in enumerate(used):
+            tile = Image.fromarray(tiles[j], 'RGB')
+            ImageDraw.Draw(tile).text((cell_size / 2, cell_size / 2), str(palette.coco[i]),
+                                      fill=text_fill[i], font=font, anchor='mm')
+            tiles[j] = np.asarray(tile)
+    rgb = tiles[local.reshape(height, width)].transpose(0, 2, 1, 3, 4).reshape(height * cell_size, width * cell_size, 3)
+    if grid:
+        rgb[::cell_size, :] = GRID_COLOR
+        rgb[:, ::cell_size] = GRID_COLOR
+        # each cell draws its top and left edge; these close the last row and column
+        rgb[-1, :] = GRID_COLOR
+        rgb[:, -1] = GRID_COLOR
+    return Image.fromarray(rgb, 'RGB')
+
+def text_colors(palette: Palette) -> list[tuple[int, int, int]]:
+    luminance = palette.rgb @ np.array([0.299, 0.587, 0.114]) / 255
+    return [(255, 255, 255) if value < 0.5 else (0, 0, 0) for value in luminance]
+
+def code_grid(image_fixture: ImageFixture, map_choice: ColorMapChoice) -> list[list[str]]:
+    return image_fixture.palette.coco[map_choice.mapped_grid()].tolist()
+
+def bead_counts(image_fixture: ImageFixture, map_choice: ColorMapChoice) -> np.ndarray:
+    return np.bincount(map_choice.mapped_grid().ravel(), minlength=len(image_fixture.palette))
+
+def bill_of_materials(image_fixture: ImageFixture, map_choice: ColorMapChoice) -> list[dict]:
+    return bom_rows(image_fixture.palette, bead_counts(image_fixture, map_choice))
+
+def bom_rows(palette: Palette, counts: np.ndarray) -> list[dict]:
+    used = sorted(np.flatnonzero(counts), key=lambda i: palette.coco[i])
+    return [{'coco': str(palette.coco[i]), 'mard': str(palette.mard[i]), 'hex': str(palette.hex[i]),
+             'available': bool(palette.available[i]), 'count': int(counts[i])} for i in used]
+
+def board_tiles(height: int, width: int, board_size: int) -> list[tuple[int, int, int, int]]:
+    return [(y0, x0, min(y0 + board_size, height), min(x0 + board_size, width))
+            for y0 in range(0, height, board_size) for x0 in range(0, width, board_size)]
+
+def render_sheets(image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int,
+                  board_size: int) -> list[Image.Image]:
+    palette = image_fixture.palette
+    grid = map_choice.mapped_grid()
+    page_width = board_size * cell_size + 2 * PAGE_MARGIN
+    page_height = board_size * cell_size + 2 * PAGE_MARGIN
+    pages = []
+    for y0, x0, y1, x1 in board_tiles(*grid.shape, board_size):
+        page = Image.new('RGB', (page_width, page_height), 'white')
+        page.paste(render_grid(palette, grid[y0:y1, x0:x1], cell_size, grid=True, codes=True),
+                   (PAGE_MARGIN, PAGE_MARGIN))
+        draw = ImageDraw.Draw(page)
+        draw.rectangle((PAGE_MARGIN - 1, PAGE_MARGIN - 1, PAGE_MARGIN + (x1 - x0) * cell_size,
+                        PAGE_MARGIN + (y1 - y0) * cell_size), outline=BOARD_COLOR)
+        draw.text((PAGE_MARGIN, PAGE_MARGIN / 2), _board_title(y0, x0, y1, x1, board_size),
+                  fill=BOARD_COLOR, anchor='lm')
+        pages.append(page)
+    rows = bom_rows(palette, np.bincount(grid.ravel(), minlength=len(palette)))
+    pages.extend(_render_legend(rows, page_width, page_height))
+    return pages
+
+def _board_title(y0, x0, y1, x1, board_size) -> str:
+    return f"Board row {y0 // board_size + 1}, column {x0 // board_size + 1} (cells x {x0}-{x1 - 1}, y {y0}-{y1 - 1})"
+
+def _render_legend(rows: list[dict], page_width: int, page_height: int) -> list[Image.Image]:
+    per_page = max((page_height - 3 * PAGE_MARGIN) // LEGEND_ROW, 1)
+    total = sum(row['count'] for row in rows)
+    pages = []
+    for start in range(0, max(len(rows), 1), per_page):
+        page = Image.new('RGB', (page_width, page_height), 'white')
+        draw = ImageDraw.Draw(page)
+        draw.text((PAGE_MARGIN, PAGE_MARGIN / 2), f"Legend: {len(rows)} colors, {total} beads",
+                  fill=BOARD_COLOR, anchor='lm')
+        for i, row in enumerate(rows[start:start + per_page]):
+            y = PAGE_MARGIN + i * LEGEND_ROW
+            draw.rectangle((PAGE_MARGIN, y, PAGE_MARGIN + LEGEND_ROW - 4, y + LEGEND_ROW - 4),
+                           fill='#' + row['hex'], outline=GRID_COLOR if row['available'] else 'red')
+            draw.text((PAGE_MARGIN + LEGEND_ROW + 4, y + (LEGEND_ROW - 4) / 2),
+                      f"{row['coco']}  {row['mard']}  #{row['hex']}  x{row['count']}", fill=BOARD_COLOR, anchor='lm')
+        pages.append(page)
+    return pages
+
+def save_pdf(path, image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int, board_size: int):
+    pages = render_sheets(image_fixture, map_choice, cell_size, board_size)
+    pages[0].save(path, 'PDF', save_all=True, append_images=pages[1:])
+
+def svg_pages(image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int,
+              board_size: int) -> list[str]:
+    palette = image_fixture.palette
+    grid = map_choice.mapped_grid()
+    text_fill = ['#%02x%02x%02x' % color for color in text_colors(palette)]
+    size = board_size * cell_size + 2 * PAGE_MARGIN
+    pages = []
+    for y0, x0, y1, x1 in board_tiles(*grid.shape, board_size):
+        parts = [f'<text x="{PAGE_MARGIN}" y="{PAGE_MARGIN / 2}">{escape(_board_title(y0, x0, y1, x1, board_size))}</text>']
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                i = grid[y, x]
+                px, py = PAGE_MARGIN + (x - x0) * cell_size, PAGE_MARGIN + (y - y0) * cell_size
+                parts.append(f'<rect x="{px}" y="{py}" width="{cell_size}" height="{cell_size}" '
+                             f'fill="#{palette.hex[i]}" stroke="grey"/>')
+                parts.append(f'<text x="{px + cell_size / 2}" y="{py + cell_size / 2}" fill="{text_fill[i]}" '
+                             f'font-size="{cell_size / 3:.1f}" text-anchor="middle" dominant-baseline="central">'
+                             f'{escape(str(palette.coco[i]))}</text>')
+        pages.append(_svg_document(size, size, parts))
+    rows = bom_rows(palette, np.bincount(grid.ravel(), minlength=len(palette)))
+    parts = [f'<text x="{PAGE_MARGIN}" y="{PAGE_MARGIN / 2}">Legend: {len(rows)} colors, '
+             f'{sum(row["count"] for row in rows)} beads</text>']
+    for i, row in enumerate(rows):
+        y = PAGE_MARGIN + i * LEGEND_ROW
+        parts.append(f'<rect x="{PAGE_MARGIN}" y="{y}" width="{LEGEND_ROW - 4}" height="{LEGEND_ROW - 4}" '
+                     f'fill="#{row["hex"]}" stroke="{"grey" if row["available"] else "red"}"/>')
+        parts.append(f'<text x="{PAGE_MARGIN + LEGEND_ROW + 4}" y="{y + (LEGEND_ROW - 4) / 2}" dominant-baseline="central">'
+                     f'{escape(row["coco"])}  {escape(row["mard"])}  #{row["hex"]}  x{row["count"]}</text>')
+    pages.append(_svg_document(size, max(size, 2 * PAGE_MARGIN + len(rows) * LEGEND_ROW), parts))
+    return pages
+
+def _svg_document(width, height, parts: list[str]) -> str:
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif">'
+            f'<rect width="100%" height="100%" fill="white"/>' + ''.join(parts) + '</svg>\n')
+
+def save_svg(path, image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int, board_size: int):
+    # SVG has no pages, so every board and the legend get their own numbered file
+    stem, ext = os.path.splitext(path)
+    for n, page in enumerate(svg_pages(image_fixture, map_choice, cell_size, board_size), 1):
+        with open(f"{stem}-{n:02d}{ext}", 'w') as f:
+            f.write(page)
+
+def export_pattern(path, image_fixture: ImageFixture, map_choice: ColorMapChoice, cell_size: int,
+                   board_size: int, grid=True, codes=True):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pdf':
+        save_pdf(path, image_fixture, map_choice, cell_size, board_size)
+    elif ext == '.svg':
+        save_svg(path, image_fixture, map_choice, cell_size, board_size)
+    else:
+        render_pattern(image_fixture, map_choice, cell_size, grid=grid, codes=codes).save(path)
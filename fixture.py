@@ -0,0 +1,153 @@
+import numpy as np
+from PIL import Image
+import color as clr
+import instrument
+from matcher import get_matcher
+from model import ColorEntry, ColorEntryMatch, Palette
+from main import config
+
+# unique colors matched between progress reports
+MATCH_PROGRESS_CHUNK = 4096
+
+class ImageFixture:
+    def __init__(self, palette: Palette, src_rgb: np.ndarray, index: np.ndarray,
+                 match_idx: np.ndarray, match_dist: np.ndarray):
+        self.palette = palette
+        self.src_rgb = src_rgb          # (U, 3) unique source colors
+        self.index = index              # (height, width) source color index of every cell
+        self.match_idx = match_idx      # (U, K) palette indices, best match first
+        self.match_dist = match_dist    # (U, K) distances to those matches
+        self.height, self.width = index.shape
+        self._src_hex = None
+
+    @property
+    def count(self) -> int:
+        return len(self.src_rgb)
+
+    @property
+    def src_hex(self) -> list[str]:
+        if self._src_hex is None:
+            self._src_hex = [f"#{value:06x}" for value in pack_rgb(self.src_rgb).tolist()]
+        return self._src_hex
+
+class ColorMapChoice:
+    def __init__(self, image_fixture: ImageFixture):
+        self.image_fixture = image_fixture
+        self.choices = np.zeros(image_fixture.count, dtype=np.intp)
+
+    @property
+    def count(self):
+        return len(self.choices)
+    
+    def set_mapped_color_for(self, src_idx, new_choice_idx):
+        self.choices[src_idx] = new_choice_idx
+    
+    def reset_all_map_choice(self):
+        self.choices[:] = 0
+    
+    def get_mapped_index_for(self, src_idx) -> int:
+        return int(self.image_fixture.match_idx[src_idx, self.choices[src_idx]])
+
+    def get_mapped_color_for(self, src_idx) -> ColorEntryMatch:
+        fixture = self.image_fixture
+        choice = self.choices[src_idx]
+        return ColorEntryMatch(fixture.palette[fixture.match_idx[src_idx, choice]],
+                               float(fixture.match_dist[src_idx, choice]))
+    
+    def get_all_mapped_colors_for(self, src_idx) -> list[ColorEntryMatch]:
+        fixture = self.image_fixture
+        return clr.to_matches(fixture.palette, fixture.match_idx[src_idx], fixture.match_dist[src_idx])
+    
+    def mapped_indices(self) -> np.ndarray:
+        fixture = self.image_fixture
+        return fixture.match_idx[np.arange(fixture.count), self.choices]
+
+    def mapped_grid(self) -> np.ndarray:
+        return self.mapped_indices()[self.image_fixture.index]
+
+    def get_unique_mapped_colors(self) -> set[ColorEntry]:
+        palette = self.image_fixture.palette
+        return {palette[i] for i in np.unique(self.mapped_indices())}
+
+def read_rgb(image: Image.Image, background=(255, 255, 255)) -> np.ndarray:
+    # any mode goes through RGBA; transparency is composited over the background color
+    if image.mode == 'RGB':
+        return np.asarray(image)
+    rgba = np.asarray(image.convert('RGBA'), dtype=np.uint32)
+    alpha = rgba[..., 3:]
+    rgb = (rgba[..., :3] * alpha + np.asarray(background, dtype=np.uint32) * (255 - alpha) + 127) // 255
+    return rgb.astype(np.uint8)
+
+def pack_rgb(rgb: np.ndarray) -> np.ndarray:
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def unpack_rgb(packed: np.ndarray) -> np.ndarray:
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack([packed >> 16, packed >> 8, packed], axis=-1).astype(np.uint8)
+
+def read_src_rgb(src_img_path) -> np.ndarray:
+    with instrument.timer('ingest.read'):
+        rgb = read_rgb(Image.open(src_img_path), clr.hex_to_rgb(config.BACKGROUND))
+    if config.TARGET_WIDTH or config.TARGET_HEIGHT:
+        import tiling
+        with instrument.timer('ingest.resample'):
+            rgb = tiling.resample(rgb, config.TARGET_WIDTH, config.TARGET_HEIGHT)
+    return rgb
+
+def iter_match_rgb(repository: Palette, rgb: np.ndarray, matcher=None, chunk_size=None):
+    # yields (image_fixture, matched count) as the match table fills in place, chunk_size unique colors at a time
+    height, width = rgb.shape[:2]
+    with instrument.timer('ingest.unique'):
+        uniq_packed, inverse = np.unique(pack_rgb(rgb).ravel(), return_inverse=True)
+        src_rgb = unpack_rgb(uniq_packed)
+    instrument.count('pixels', height * width)
+    instrument.count('unique_colors', len(src_rgb))
+    matcher = matcher or get_matcher(repository)
+    index = inverse.reshape(height, width).astype(np.uint16 if len(src_rgb) <= 1 << 16 else np.uint32)
+    chunk_size = chunk_size or len(src_rgb)
+    image_fixture = None
+    for start in range(0, len(src_rgb), chunk_size):
+        with instrument.timer('match'):
+            match_idx, match_dist = matcher.match(src_rgb[start:start + chunk_size])
+        if image_fixture is None:
+            k = match_idx.shape[1]
+            image_fixture = ImageFixture(repository, src_rgb, index,
+                                         np.zeros((len(src_rgb), k), dtype=np.uint16 if len(repository) <= 1 << 16 else np.uint32),
+                                         np.zeros((len(src_rgb), k), dtype=np.float32))
+        image_fixture.match_idx[start:start + len(match_idx)] = match_idx
+        image_fixture.match_dist[start:start + len(match_idx)] = match_dist
+        yield image_fixture, start + len(match_idx)
+
+def match_rgb(repository: Palette, rgb: np.ndarray, matcher=None, progress=None) -> ImageFixture:
+    if progress is None:
+        return next(iter_match_rgb(repository, rgb, matcher))[0]
+    for image_fixture, matched in iter_match_rgb(repository, rgb, matcher, MATCH_PROGRESS_CHUNK):
+        progress('Matching colors', matched / image_fixture.count)
+    return image_fixture
+
+def build_fixture(repository: Palette, rgb: np.ndarray, matcher=None, candidates=None, progress=None) -> ImageFixture:
+    image_fixture = match_rgb(repository, rgb, matcher, progress)
+    if candidates is None and config.MAX_COLORS:
+        import reduction
+        if progress:
+            progress('Reducing palette', None)
+        with instrument.timer('reduce'):
+            candidates = reduction.select_palette(image_fixture, config.MAX_COLORS, config.AVAIALABLE_ONLY,
+                                                  config.METRIC)
+    if candidates is not None:
+        import reduction
+        with instrument.timer('reduce'):
+            image_fixture = reduction.remap_to_subset(image_fixture, candidates, config.METRIC)
+    if config.DITHER:
+        import dither
+        if progress:
+            progress('Dithering', None)
+        with instrument.timer('dither'):
+            image_fixture = dither.apply_dither(image_fixture, config.DITHER, config.DITHER_SERPENTINE,
+                                                config.AVAIALABLE_ONLY, config.METRIC, candidates,
+                                                config.CACHE_DIR)
+    return image_fixture
+
+def load_src_img(repository: Palette, src_img_path, matcher=None) -> ImageFixture:
+    return build_fixture(repository, read_src_rgb(src_img_path), matcher)
@@ -1,88 +1,217 @@
+import queue
+import threading
 import tkinter as tk
-from PIL import Image
+from tkinter import filedialog, ttk
+import numpy as np
+from PIL import Image, ImageTk
 import color as clr
+import instrument
 import repo as repo
-from model import ColorEntry, ColorEntryMatch
+import export
+from fixture import ImageFixture, ColorMapChoice, MATCH_PROGRESS_CHUNK, build_fixture, iter_match_rgb, read_src_rgb
+from matcher import get_matcher
 from main import config
 
-class ImageFixture:
-    def __init__(self, width: int, height: int, pixels: list[list[str]], 
-                 color_map: dict[str, list[ColorEntryMatch]]):
-        self.width = width
-        self.height = height
-        self.pixels = pixels
-        self.color_map = color_map
-
-class ColorMapChoice:
-    def __init__(self, image_fixture: ImageFixture):
-        self.color_map = image_fixture.color_map
-        self.color_map_choice = {hex_str: 0 for hex_str in image_fixture.color_map}
-
-    @property
-    def count(self):
-        return len(self.color_map_choice)
-    
-    def set_mapped_color_for(self, hex_str, new_choice_idx):
-        self.color_map_choice[hex_str] = new_choice_idx
-    
-    def reset_all_map_choice(self):
-        for hex_str in self.color_map_choice:
-            self.color_map_choice[hex_str] = 0
-    
-    def get_mapped_color_for(self, hex_str) -> ColorEntryMatch:
-        return self.color_map[hex_str][self.color_map_choice[hex_str]]
-    
-    def get_all_mapped_colors_for(self, hex_str) -> list[ColorEntryMatch]:
-        return self.color_map[hex_str]
-    
-    def get_complete_map(self) -> dict[str, ColorEntryMatch]:
-        return {orig_hex_str: self.get_mapped_color_for(orig_hex_str) for orig_hex_str in self.color_map}
-
-    def get_unique_mapped_colors(self) -> set[ColorEntry]:
-        return {self.get_mapped_color_for(orig_hex_str).color for orig_hex_str in self.color_map}
-
-class SrcImgCanvas(tk.Canvas):
+# one canvas item per cell, or a raster image once the board is too big for that: one pixel per cell,
+# zoomed up by the cell size only for the part of the board in view
+class BoardCanvas(tk.Canvas):
     def __init__(self, root, image_fixture: ImageFixture, **kwargs):
         self.image_fixture = image_fixture
+        self.cell_size = config.CELL_SIZE
+        self.raster = image_fixture.width * image_fixture.height > config.RASTER_THRESHOLD
+        board_width, board_height = image_fixture.width * self.cell_size, image_fixture.height * self.cell_size
+        self.var_outline = True
+        if self.raster:
+            super().__init__(root, width=min(board_width, config.RASTER_VIEWPORT),
+                             height=min(board_height, config.RASTER_VIEWPORT),
+                             scrollregion=(0, 0, board_width, board_height), **kwargs)
+            self.photo = None
+            self.view_photo = None
+            self.photo_item = self.create_image(0, 0, anchor='nw')
+            instrument.count('canvas_items')
+            self.bind('<Configure>', lambda event: self.redraw_view())
+            self.bind('<ButtonPress-3>', lambda event: self.scan_mark(event.x, event.y))
+            self.bind('<B3-Motion>', self._drag)
+            for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+                self.bind(sequence, self._scroll)
+        else:
+            super().__init__(root, width=board_width, height=board_height, **kwargs)
+
+    def cell_at(self, event) -> tuple[int, int] | None:
+        x, y = int(self.canvasx(event.x) // self.cell_size), int(self.canvasy(event.y) // self.cell_size)
+        if 0 <= x < self.image_fixture.width and 0 <= y < self.image_fixture.height:
+            return x, y
+        return None
+
+    def draw_raster(self, rgb: np.ndarray):
+        self.photo = ImageTk.PhotoImage(Image.fromarray(rgb, 'RGB'))
+        self.redraw_view()
+
+    def redraw_view(self):
+        if self.photo is not None:
+            x0, y0, x1, y1 = self.visible_cells()
+            cs = self.cell_size
+            if self.view_photo is None:
+                # no declared size, so the copy below sizes it to the region in view
+                self.view_photo = ImageTk.PhotoImage('RGB', (0, 0))
+                self.itemconfig(self.photo_item, image=self.view_photo)
+            self.tk.call(str(self.view_photo), 'copy', str(self.photo), '-from', x0, y0, x1, y1,
+                         '-zoom', cs, cs, '-shrink')
+            self.coords(self.photo_item, x0 * cs, y0 * cs)
+        self.redraw_overlay()
+
+    def visible_cells(self) -> tuple[int, int, int, int]:
+        x0 = max(int(self.canvasx(0) // self.cell_size), 0)
+        y0 = max(int(self.canvasy(0) // self.cell_size), 0)
+        x1 = min(int(self.canvasx(self.winfo_width()) // self.cell_size) + 1, self.image_fixture.width)
+        y1 = min(int(self.canvasy(self.winfo_height()) // self.cell_size) + 1, self.image_fixture.height)
+        return x0, y0, x1, y1
+
+    def redraw_overlay(self):
+        # grid lines and labels only exist for the cells in view, and only when cells are big enough to read
+        self.delete('overlay')
+        if not self.raster or self.cell_size < config.RASTER_OVERLAY_MIN_CELL_SIZE:
+            return
+        x0, y0, x1, y1 = self.visible_cells()
+        if self.var_outline:
+            instrument.count('canvas_items', x1 - x0 + y1 - y0 + 2)
+            cs = self.cell_size
+            for x in range(x0, x1 + 1):
+                self.create_line(x * cs, y0 * cs, x * cs, y1 * cs, fill='grey', tags='overlay')
+            for y in range(y0, y1 + 1):
+                self.create_line(x0 * cs, y * cs, x1 * cs, y * cs, fill='grey', tags='overlay')
+        self.draw_labels(x0, y0, x1, y1)
+
+    def draw_labels(self, x0, y0, x1, y1):
+        pass
+
+    def _drag(self, event):
+        self.scan_dragto(event.x, event.y, gain=1)
+        self.redraw_view()
+
+    def _scroll(self, event):
+        self.yview_scroll(-1 if event.num == 4 or event.delta > 0 else 1, 'units')
+        self.redraw_view()
+
+class SrcImgCanvas(BoardCanvas):
+    def __init__(self, root, image_fixture: ImageFixture, **kwargs):
+        super().__init__(root, image_fixture, **kwargs)
+        if self.raster:
+            self.draw_raster(image_fixture.src_rgb[image_fixture.index])
+            return
         width, height = image_fixture.width, image_fixture.height
-        super().__init__(root, width=width*config.CELL_SIZE, height=height*config.CELL_SIZE, **kwargs)
+        instrument.count('canvas_items', width * height)
+        src_hex = image_fixture.src_hex
         for x in range(width):
             for y in range(height):
                 position = x * config.CELL_SIZE, y * config.CELL_SIZE, (x + 1) * config.CELL_SIZE, (y + 1) * config.CELL_SIZE
-                self.create_rectangle(position, fill=image_fixture.pixels[x][y], tags=f"rect_{x}_{y}")
+                self.create_rectangle(position, fill=src_hex[image_fixture.index[y, x]], tags='cell')
     
     def update(self, var_outline):
-        width, height = self.image_fixture.width, self.image_fixture.height
-        for x in range(width):
-            for y in range(height):
-                self.itemconfig(f"rect_{x}_{y}", outline='grey' if var_outline else '')
+        self.var_outline = var_outline
+        if self.raster:
+            self.redraw_overlay()
+        else:
+            self.itemconfig('cell', outline='grey' if var_outline else '')
 
-class RltImgCanvas(tk.Canvas):
+class RltImgCanvas(BoardCanvas):
     def __init__(self, root, image_fixture: ImageFixture, **kwargs):
-        self.image_fixture = image_fixture
+        super().__init__(root, image_fixture, **kwargs)
         self.change_focus_lambda = lambda x, y: None
+        self.var_label = True
+        self.var_map_choice = None
+        self.bind('<Button-1>', self._click)
+        # inverted index: the cells of every source color
+        flat_index = image_fixture.index.ravel()
+        order = np.argsort(flat_index, kind='stable')
+        bounds = np.cumsum(np.bincount(flat_index, minlength=image_fixture.count))[:-1]
+        if self.raster:
+            self.cells_of = np.split(order, bounds)
+            return
         width, height = image_fixture.width, image_fixture.height
-        super().__init__(root, width=width*config.CELL_SIZE, height=height*config.CELL_SIZE, **kwargs)
+        instrument.count('canvas_items', 2 * width * height)
+        self.rect_ids = np.empty((height, width), dtype=np.int64)
+        self.text_ids = np.empty((height, width), dtype=np.int64)
         for x in range(width):
             for y in range(height):
                 position = x * config.CELL_SIZE, y * config.CELL_SIZE, (x + 1) * config.CELL_SIZE, (y + 1) * config.CELL_SIZE
-                cell = self.create_rectangle(position, tags=f"rect_{x}_{y}")
-                text = self.create_text((x + 0.5) * config.CELL_SIZE, (y + 0.5) * config.CELL_SIZE, text='', tags=f"text_{x}_{y}")
-                self.tag_bind(text, '<Button-1>', lambda event, x=x, y=y: self.change_focus_lambda(x, y))
-                self.tag_bind(cell, '<Button-1>', lambda event, x=x, y=y: self.change_focus_lambda(x, y))
+                self.rect_ids[y, x] = self.create_rectangle(position, tags='cell')
+                self.text_ids[y, x] = self.create_text((x + 0.5) * config.CELL_SIZE, (y + 0.5) * config.CELL_SIZE,
+                                                       text='', tags='label')
+        self.rect_ids_of = np.split(self.rect_ids.ravel()[order], bounds)
+        self.text_ids_of = np.split(self.text_ids.ravel()[order], bounds)
     
     def assign_event(self, change_focus_lambda):
         self.change_focus_lambda = change_focus_lambda
 
+    def _click(self, event):
+        cell = self.cell_at(event)
+        if cell is not None:
+            self.change_focus_lambda(*cell)
+
     def update(self, var_map_choice: ColorMapChoice, var_label:  bool, var_outline: bool):
-        width, height = self.image_fixture.width, self.image_fixture.height
-        for x in range(width):
-            for y in range(height):
-                chosen_mapped_color = var_map_choice.get_mapped_color_for(self.image_fixture.pixels[x][y])
-                self.itemconfig(f"rect_{x}_{y}", fill='#' + chosen_mapped_color.color.hex,
-                                    outline='grey' if var_outline else '')
-                self.itemconfig(f"text_{x}_{y}", text=chosen_mapped_color.color.coco if var_label else '',
-                                    fill=get_contrasting_text_color_hex_str(chosen_mapped_color.color.hex))
+        self.var_label, self.var_outline = var_label, var_outline
+        self.update_colors(var_map_choice, range(self.image_fixture.count))
+        if not self.raster:
+            self.set_label(var_label)
+            self.set_outline(var_outline)
+
+    def update_colors(self, var_map_choice: ColorMapChoice, src_indices):
+        self.var_map_choice = var_map_choice
+        palette = self.image_fixture.palette
+        if self.raster:
+            if self.photo is None or len(src_indices) == self.image_fixture.count:
+                self.draw_raster(palette.rgb[var_map_choice.mapped_grid()])
+                return
+            for src_idx in src_indices:
+                self.paint_cells(self.cells_of[src_idx], palette[var_map_choice.get_mapped_index_for(src_idx)].hex)
+            self.redraw_view()
+            return
+        for src_idx in src_indices:
+            chosen_color = palette[var_map_choice.get_mapped_index_for(src_idx)]
+            fill = '#' + chosen_color.hex
+            text_fill = get_contrasting_text_color_hex_str(chosen_color.hex)
+            for item in self.rect_ids_of[src_idx].tolist():
+                self.itemconfig(item, fill=fill)
+            for item in self.text_ids_of[src_idx].tolist():
+                self.itemconfig(item, text=chosen_color.coco, fill=text_fill)
+
+    def paint_cells(self, cells: np.ndarray, hex_str: str):
+        # recolors the pixels of these cells in the existing image; a run of neighbours in a row is one put
+        if not len(cells):
+            return
+        width = self.image_fixture.width
+        ys, xs = np.divmod(cells, width)
+        starts = np.flatnonzero((np.diff(cells, prepend=-2) != 1) | (xs == 0))
+        ends = np.append(starts[1:], len(cells)) - 1
+        for y, x0, x1 in zip(ys[starts].tolist(), xs[starts].tolist(), xs[ends].tolist()):
+            self.tk.call(str(self.photo), 'put', '#' + hex_str, '-to', x0, y, x1 + 1, y + 1)
+
+    def set_label(self, var_label: bool):
+        self.var_label = var_label
+        if self.raster:
+            self.redraw_overlay()
+        else:
+            self.itemconfig('label', state='normal' if var_label else 'hidden')
+
+    def set_outline(self, var_outline: bool):
+        self.var_outline = var_outline
+        if self.raster:
+            self.redraw_overlay()
+        else:
+            self.itemconfig('cell', outline='grey' if var_outline else '')
+
+    def draw_labels(self, x0, y0, x1, y1):
+        if not self.var_label or self.var_map_choice is None:
+            return
+        palette = self.image_fixture.palette
+        mapped_grid = self.var_map_choice.mapped_grid()
+        instrument.count('canvas_items', (y1 - y0) * (x1 - x0))
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                chosen_color = palette[mapped_grid[y, x]]
+                self.create_text((x + 0.5) * self.cell_size, (y + 0.5) * self.cell_size, text=chosen_color.coco,
+                                 fill=get_contrasting_text_color_hex_str(chosen_color.hex), tags='overlay')
 
 class FocusPalette(tk.Canvas):
     def __init__(self, root, image_fixture: ImageFixture, **kwargs):
@@ -118,9 +247,10 @@ class FocusPalette(tk.Canvas):
         self.change_map_choice_lambda = change_map_choice_lambda
 
     def update(self, var_map_choice: ColorMapChoice, var_fx: int, var_fy: int):
-        orig_hex_str = self.image_fixture.pixels[var_fx][var_fy]
-        chosen_mapped_color = var_map_choice.get_mapped_color_for(orig_hex_str)
-        all_mapped_colors = var_map_choice.get_all_mapped_colors_for(orig_hex_str)
+        src_idx = self.image_fixture.index[var_fy, var_fx]
+        orig_hex_str = self.image_fixture.src_hex[src_idx]
+        chosen_mapped_color = var_map_choice.get_mapped_color_for(src_idx)
+        all_mapped_colors = var_map_choice.get_all_mapped_colors_for(src_idx)
 
         self.itemconfig('target_color', fill=orig_hex_str)
         self.itemconfig('target_text', text="TARGET-" + orig_hex_str,
@@ -131,9 +261,14 @@ class FocusPalette(tk.Canvas):
                         fill=get_contrasting_text_color_hex_str(chosen_mapped_color.color.hex))
 
         for i in range(config.K):
+            # a reduced palette can leave fewer than K options
+            if i >= len(all_mapped_colors):
+                self.itemconfig(f'option_color_{i}', state='hidden')
+                self.itemconfig(f'option_text_{i}', state='hidden')
+                continue
             cur_option_color = all_mapped_colors[i]
-            self.itemconfig(f'option_color_{i}', fill='#' + cur_option_color.color.hex)
-            self.itemconfig(f'option_text_{i}', text=cur_option_color.color.coco,
+            self.itemconfig(f'option_color_{i}', fill='#' + cur_option_color.color.hex, state='normal')
+            self.itemconfig(f'option_text_{i}', text=cur_option_color.color.coco, state='normal',
                             fill=get_contrasting_text_color_hex_str(cur_option_color.color.hex))
 
 class ButtonGroup(tk.Frame):
@@ -156,15 +291,16 @@ class ColorSummary(tk.Canvas):
         self.cell_size = 40
         self.interval = 5
 
+        instrument.count('canvas_items', 3 * image_fixture.count)
         x = 10
-        for i, orig_hex in enumerate(image_fixture.color_map):
+        for i, orig_hex in enumerate(image_fixture.src_hex):
             y0 = i * (self.cell_size + self.interval) + 10 
             x1 = x + self.cell_size 
             y1 = y0 + self.cell_size
             self.create_rectangle(x, y0, x1, y1, fill=orig_hex, outline='grey')
         
         x += self.cell_size + self.interval
-        for i, orig_hex in enumerate(image_fixture.color_map):
+        for i in range(image_fixture.count):
             y0 = i * (self.cell_size + self.interval) + 10 
             x1 = x + self.cell_size 
             y1 = y0 + self.cell_size
@@ -173,14 +309,17 @@ class ColorSummary(tk.Canvas):
         
         self.config(scrollregion=self.bbox("all")) # let canvas know the scrollable region
     
-    def update(self, var_map_choice: ColorMapChoice):
-        for i, orig_hex in enumerate(self.image_fixture.color_map):
-            chosen_mapped_color = var_map_choice.get_mapped_color_for(orig_hex)
-            self.itemconfig(f"mappped_color_{i}", fill='#' + chosen_mapped_color.color.hex)
-            self.itemconfig(f"mappped_text_{i}", text=chosen_mapped_color.color.coco,
-                            fill=get_contrasting_text_color_hex_str(chosen_mapped_color.color.hex))
+    def update(self, var_map_choice: ColorMapChoice, src_indices=None):
+        palette = self.image_fixture.palette
+        if src_indices is None:
+            src_indices = range(self.image_fixture.count)
+        for i in src_indices:
+            chosen_color = palette[var_map_choice.get_mapped_index_for(i)]
+            self.itemconfig(f"mappped_color_{i}", fill='#' + chosen_color.hex)
+            self.itemconfig(f"mappped_text_{i}", text=chosen_color.coco,
+                            fill=get_contrasting_text_color_hex_str(chosen_color.hex))
         
-        self.delete(*self.find_withtag("unique_*"))
+        self.delete("unique")
         uniques = list(var_map_choice.get_unique_mapped_colors())
         uniques.sort(key=lambda clr:clr.coco)
         x = 10 + 2 * (self.cell_size + self.interval) + self.interval * 2
@@ -189,129 +328,259 @@ class ColorSummary(tk.Canvas):
             x1 = x + self.cell_size 
             y1 = y0 + self.cell_size
             self.create_rectangle(x, y0, x1, y1, fill='#' + clr.hex, outline='grey' if clr.available else 'red',
-                                   tags=f"unique_color_{i}",
+                                   tags=("unique", f"unique_color_{i}"),
                                     width=1 if clr.available else 3)
             self.create_text(x + self.cell_size / 2, y0 + self.cell_size / 2, text=clr.coco,
                              fill=get_contrasting_text_color_hex_str(clr.hex),
-                              tags=f"unique_text_{i}")
+                              tags=("unique", f"unique_text_{i}"))
         
 
-def load_src_img(repository: list[ColorEntry], src_img_path) -> ImageFixture:
-    image = Image.open(src_img_path)
-    pixels = image.load()
-    width, height = image.size
-    src_pxls, uniq_src_pxls = [], {}
-    for x in range(width):
-        row_pxls = []
-        for y in range(height):
-            r, g, b, a = pixels[x, y]
-            rgb = (r, g, b)
-            hex_str = clr.rgb_to_hex(rgb)
-            row_pxls.append(hex_str)
-            uniq_src_pxls[hex_str] = None
-        src_pxls.append(row_pxls)
-    for hex_str in uniq_src_pxls:
-        lab_color = clr.hex_to_lab(hex_str)
-        closest_colors = clr.find_closest_colors(repository, lab_color, 
-                                                 k=config.K, available_only=config.AVAIALABLE_ONLY)
-        uniq_src_pxls[hex_str] = closest_colors
-    image_fixture = ImageFixture(width, height, src_pxls, uniq_src_pxls)
-    return image_fixture
-
 def get_contrasting_text_color_hex_str(bg_hex_str: str) -> str:
     return '#FFFFFF' if clr.calculate_luminance(bg_hex_str) < 0.5 else '#000000'
 
-def export_canvas(canvas):
-    canvas.postscript(file="output.ps", colormode='color')
-    img = Image.open("output.ps")
-    img.save("output.png", "png")
+def export_pattern(image_fixture: ImageFixture, var_map_choice: ColorMapChoice, var_label: bool, var_outline: bool):
+    path = filedialog.asksaveasfilename(
+        initialdir = ".",
+        title = "Save pattern",
+        defaultextension = ".png",
+        filetypes = (("png files","*.png"),("pdf pattern sheets","*.pdf"),("svg pattern sheets","*.svg")))
+    if not path:
+        return
+    export.export_pattern(path, image_fixture, var_map_choice, config.CELL_SIZE, config.PEGBOARD_SIZE,
+                          grid=var_outline, codes=var_label)
+
+# how often the window checks the loader's queue
+POLL_MS = 50
+
+class LoadProgress(tk.Frame):
+    def __init__(self, root, **kwargs):
+        super().__init__(root, **kwargs)
+        self.label = tk.Label(self, text='', anchor='w')
+        self.label.pack(side='left', fill='x', expand=True)
+        self.bar = ttk.Progressbar(self, length=300, maximum=1.0)
+        self.bar.pack(side='right')
+        self.open_button = tk.Button(self, text='Open')
+
+    def show(self, stage: str, fraction: float | None):
+        self.open_button.pack_forget()
+        self.label.config(text=stage)
+        if fraction is None:
+            # stages that can't report progress just show activity
+            self.bar.config(mode='indeterminate')
+            self.bar.start()
+        else:
+            self.bar.stop()
+            self.bar.config(mode='determinate', value=fraction)
+
+    def clear(self, text=''):
+        self.open_button.pack_forget()
+        self.bar.stop()
+        self.bar.config(mode='determinate', value=0)
+        self.label.config(text=text)
+
+    def offer_open(self, open_image):
+        self.open_button.config(command=open_image)
+        self.open_button.pack(side='right')
+
+class Workspace(tk.Frame):
+    def __init__(self, root, image_fixture: ImageFixture, open_image, **kwargs):
+        super().__init__(root, **kwargs)
+        self.image_fixture = image_fixture
+        self.var_map_choice = ColorMapChoice(image_fixture)
+        self.var_fx, self.var_fy = 0, 0
+        self.var_label, self.var_outline = True, True
+        # the match table may still be filling in; focus, summary and export wait for it
+        self.ready = False
+
+        left_pane = tk.Frame(self)
+        right_pane = tk.Frame(self)
+
+        with instrument.timer('gui.src_canvas'):
+            self.src_canvas = SrcImgCanvas(left_pane, image_fixture=image_fixture)
+            self.src_canvas.update(self.var_outline)
+        self.src_canvas.grid(row=0, column=0)
+
+        with instrument.timer('gui.result_canvas'):
+            self.rlt_canvas = RltImgCanvas(left_pane, image_fixture=image_fixture)
+        self.rlt_canvas.grid(row=0, column=1)
+        self.rlt_canvas.assign_event(self.change_focus)
+
+        self.focus_palette = FocusPalette(left_pane, image_fixture=image_fixture)
+        self.focus_palette.grid(row=1, column=0, columnspan=2)
+        self.focus_palette.assign_event(self.change_map_choice)
+
+        btn_group = ButtonGroup(left_pane)
+        btn_group.add_button("Open", open_image)
+        btn_group.add_button("Label", self.change_label)
+        btn_group.add_button("Outline", self.change_outline)
+        btn_group.add_button("Reset", self.reset_all_map_choice)
+        btn_group.add_button("Save", self.save)
+        btn_group.add_button("Exit", root.destroy)
+        btn_group.grid(row=3, column=0, columnspan=2)
+
+        with instrument.timer('gui.color_summary'):
+            self.color_summary = ColorSummary(right_pane, image_fixture=image_fixture)
+        self.color_summary.pack(side="left", fill="both", expand=True)
+
+        left_pane.pack(side='left')
+        right_pane.pack(side='right', fill='y')
+
+    def fill(self, start: int, stop: int):
+        # cell canvases color in as each chunk of source colors is matched; the raster waits for finish()
+        if not self.rlt_canvas.raster:
+            self.rlt_canvas.update_colors(self.var_map_choice, range(start, stop))
+
+    def finish(self):
+        self.ready = True
+        with instrument.timer('gui.result_update'):
+            self.rlt_canvas.update(self.var_map_choice, self.var_label, self.var_outline)
+        with instrument.timer('gui.focus_palette'):
+            self.focus_palette.update(self.var_map_choice, self.var_fx, self.var_fy)
+        with instrument.timer('gui.color_summary'):
+            self.color_summary.update(self.var_map_choice)
+
+    def change_focus(self, x, y):
+        self.var_fx, self.var_fy = x, y
+        if self.ready:
+            self.focus_palette.update(self.var_map_choice, x, y)
+
+    def change_map_choice(self, new_val):
+        if not self.ready:
+            return
+        src_idx = self.image_fixture.index[self.var_fy, self.var_fx]
+        self.var_map_choice.set_mapped_color_for(src_idx, new_val)
+        self.color_summary.update(self.var_map_choice, [src_idx])
+        self.rlt_canvas.update_colors(self.var_map_choice, [src_idx])
+        self.focus_palette.update(self.var_map_choice, self.var_fx, self.var_fy)
 
-def main():
-    cur_img_path = None
+    def reset_all_map_choice(self):
+        if not self.ready:
+            return
+        self.var_map_choice.reset_all_map_choice()
+        self.color_summary.update(self.var_map_choice)
+        self.rlt_canvas.update(self.var_map_choice, self.var_label, self.var_outline)
+        self.focus_palette.update(self.var_map_choice, self.var_fx, self.var_fy)
+
+    def change_label(self):
+        self.var_label = not self.var_label
+        self.rlt_canvas.set_label(self.var_label)
+
+    def change_outline(self):
+        self.var_outline = not self.var_outline
+        self.src_canvas.update(self.var_outline)
+        self.rlt_canvas.set_outline(self.var_outline)
+
+    def save(self):
+        if self.ready:
+            export_pattern(self.image_fixture, self.var_map_choice, self.var_label, self.var_outline)
+
+def load_image(messages: queue.Queue, path, repository=None, matcher=None):
+    # runs on a worker thread and only talks to the window through the queue
+    def progress(stage, fraction):
+        messages.put(('progress', stage, fraction))
+
+    try:
+        with instrument.timer('gui.load_image'):
+            if repository is None:
+                progress('Loading palette', None)
+                repository = repo.prepare_repository("colors.csv")
+                progress('Preparing matcher', None)
+                matcher = get_matcher(repository)
+                messages.put(('palette', repository, matcher))
+            if config.TILE:
+                import tiling
+                # one pegboard of a mural, numbered from 1 like the printed sheets
+                row, col = config.TILE
+                image_fixture = tiling.load_tile(repository, path, config.PEGBOARD_SIZE, row - 1, col - 1,
+                                                 matcher, progress)
+            else:
+                progress('Reading image', None)
+                rgb = read_src_rgb(path)
+                if config.MAX_COLORS or config.DITHER:
+                    # reduction and dithering rewrite the matches, so there is nothing to show early
+                    image_fixture = build_fixture(repository, rgb, matcher, progress=progress)
+                else:
+                    for image_fixture, matched in iter_match_rgb(repository, rgb, matcher, MATCH_PROGRESS_CHUNK):
+                        messages.put(('matched', image_fixture, matched))
+        messages.put(('done', image_fixture))
+    except Exception as e:
+        messages.put(('error', e))
+
+def ask_image_path():
+    return filedialog.askopenfilename(
+        initialdir = ".",
+        title = "Select file",
+        filetypes = (("png files","*.png"),("jpeg files","*.jpg"),("all files","*.*")))
 
-    if not cur_img_path:
-        from tkinter import filedialog
-        cur_img_path = filedialog.askopenfilename(
-            initialdir = ".",
-            title = "Select file",
-            filetypes = (("png files","*.png"),("jpeg files","*.jpg"),("all files","*.*")))
+def main():
+    cur_img_path = ask_image_path()
 
     if not cur_img_path:
         print("No image selected. Exiting.")
         exit(0)
-    
+
     root = tk.Tk()
     root.title("Beadify")
 
-    repository = repo.prepare_repository("colors.csv")
-    image_fixture = load_src_img(repository, cur_img_path)
-
-    var_map_choice = ColorMapChoice(image_fixture)
-    var_fx, var_fy = 0, 0
-    var_label, var_outline = True, True
-
-    left_pane = tk.Frame(root)
-    right_pane = tk.Frame(root)
-
-    src_canvas = SrcImgCanvas(left_pane, image_fixture=image_fixture)
-    src_canvas.update(var_outline)
-    src_canvas.grid(row=0, column=0)
-
-    rlt_canvas = RltImgCanvas(left_pane, image_fixture=image_fixture)
-    rlt_canvas.update(var_map_choice, var_label, var_outline)
-    rlt_canvas.grid(row=0, column=1)
-
-    focus_palette = FocusPalette(left_pane, image_fixture=image_fixture)
-    focus_palette.update(var_map_choice, var_fx, var_fy)
-    focus_palette.grid(row=1, column=0, columnspan=2)
-
-    def change_focus_lambda(x, y):
-        nonlocal var_fx, var_fy
-        var_fx, var_fy = x, y
-        focus_palette.update(var_map_choice, var_fx, var_fy)
-    rlt_canvas.assign_event(change_focus_lambda)
-
-    def change_map_choice_lambda(new_val):
-        nonlocal var_map_choice, var_fx, var_fy, var_label, var_outline
-        orig_hex_str = image_fixture.pixels[var_fx][var_fy]
-        var_map_choice.set_mapped_color_for(orig_hex_str, new_val)
-        color_summary.update(var_map_choice)
-        rlt_canvas.update(var_map_choice, var_label, var_outline)
-        focus_palette.update(var_map_choice, var_fx, var_fy)
-    focus_palette.assign_event(change_map_choice_lambda)
-
-    def reset_all_map_choice():
-        nonlocal var_map_choice, var_fx, var_fy, var_label, var_outline
-        var_map_choice.reset_all_map_choice()
-        color_summary.update(var_map_choice)
-        rlt_canvas.update(var_map_choice, var_label, var_outline)
-        focus_palette.update(var_map_choice, var_fx, var_fy)
-    
-    def change_label_lambda():
-        nonlocal var_label, var_outline
-        var_label = not var_label
-        src_canvas.update(var_outline)
-        rlt_canvas.update(var_map_choice, var_label, var_outline)
-    
-    def change_outline_lambda():
-        nonlocal var_label, var_outline
-        var_outline = not var_outline
-        src_canvas.update(var_outline)
-        rlt_canvas.update(var_map_choice, var_label, var_outline)
-
-    btn_group = ButtonGroup(left_pane)
-    btn_group.add_button("Label", change_label_lambda)
-    btn_group.add_button("Outline", change_outline_lambda)
-    btn_group.add_button("Reset", reset_all_map_choice)
-    btn_group.add_button("Save", lambda: export_canvas(rlt_canvas))
-    btn_group.add_button("Exit", root.destroy)
-    btn_group.grid(row=3, column=0, columnspan=2)
-
-    color_summary = ColorSummary(right_pane, image_fixture=image_fixture)
-    color_summary.update(var_map_choice)
-    color_summary.pack(side="left", fill="both", expand=True)
-
-    left_pane.pack(side='left')
-    right_pane.pack(side='right', fill='y')
-
+    progress = LoadProgress(root)
+    progress.pack(side='bottom', fill='x')
+    messages = queue.Queue()
+    # the palette and matcher stay warm across images
+    var_repository, var_matcher = None, None
+    var_workspace, var_loading = None, False
+    var_filled = 0
+
+    def start_loading(path):
+        nonlocal var_loading, var_filled
+        var_loading, var_filled = True, 0
+        threading.Thread(target=load_image, args=(messages, path, var_repository, var_matcher), daemon=True).start()
+
+    def open_image():
+        if var_loading:
+            return
+        path = ask_image_path()
+        if path:
+            start_loading(path)
+
+    def show_fixture(image_fixture):
+        nonlocal var_workspace
+        if var_workspace is not None and var_workspace.image_fixture is image_fixture:
+            return
+        if var_workspace is not None:
+            var_workspace.destroy()
+        var_workspace = Workspace(root, image_fixture, open_image)
+        var_workspace.pack(side='top', fill='both', expand=True)
+
+    def poll():
+        nonlocal var_repository, var_matcher, var_loading, var_filled
+        try:
+            while True:
+                kind, *payload = messages.get_nowait()
+                if kind == 'progress':
+                    progress.show(*payload)
+                elif kind == 'palette':
+                    var_repository, var_matcher = payload
+                elif kind == 'matched':
+                    image_fixture, matched = payload
+                    show_fixture(image_fixture)
+                    var_workspace.fill(var_filled, matched)
+                    var_filled = matched
+                    progress.show('Matching colors', matched / image_fixture.count)
+                elif kind == 'done':
+                    show_fixture(payload[0])
+                    var_workspace.finish()
+                    var_loading = False
+                    progress.clear()
+                elif kind == 'error':
+                    var_loading = False
+                    progress.clear(f"Could not load image: {payload[0]}")
+                    if var_workspace is None:
+                        # no workspace yet means no Open button to try another image with
+                        progress.offer_open(open_image)
+        except queue.Empty:
+            pass
+        root.after(POLL_MS, poll)
+
+    start_loading(cur_img_path)
+    poll()
     root.mainloop()
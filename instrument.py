@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import time
+from main import config
+
+# decided once at import: when off, timer() hands back a shared no-op and count() returns at once
+ENABLED = bool(config.PROFILE or os.environ.get('BEADIFY_PROFILE', '') not in ('', '0'))
+
+_timers = {}    # name -> [calls, total seconds]
+_counters = {}  # name -> total
+_profiler = None
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = _timers.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name: str):
+    return _Timer(name) if ENABLED else _NULL_TIMER
+
+def count(name: str, n=1):
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + int(n)
+
+def _dump_path():
+    return config.PROFILE_DUMP or os.environ.get('BEADIFY_PROFILE_DUMP')
+
+def start():
+    global _profiler
+    if ENABLED and _dump_path() and _profiler is None:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def summary() -> dict:
+    return {
+        'timers': {name: {'calls': calls, 'seconds': total} for name, (calls, total) in _timers.items()},
+        'counters': dict(_counters),
+    }
+
+def merge(other: dict):
+    # folds in a summary() taken in another process
+    for name, entry in other.get('timers', {}).items():
+        timer_entry = _timers.setdefault(name, [0, 0.0])
+        timer_entry[0] += entry['calls']
+        timer_entry[1] += entry['seconds']
+    for name, total in other.get('counters', {}).items():
+        _counters[name] = _counters.get(name, 0) + total
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+def report(file=None):
+    global _profiler
+    if not ENABLED:
+        return
+    file = file or sys.stderr
+    if _profiler is not None:
+        import pstats
+        _profiler.disable()
+        _profiler.dump_stats(_dump_path())
+        pstats.Stats(_profiler, stream=file).sort_stats('cumulative').print_stats(20)
+        _profiler = None
+    if config.PROFILE_FORMAT == 'json' or os.environ.get('BEADIFY_PROFILE') == 'json':
+        json.dump(summary(), file, indent=2)
+        file.write('\n')
+        return
+    print(f"{'timer':32s} {'calls':>8s} {'total ms':>12s} {'mean ms':>10s}", file=file)
+    for name, (calls, total) in sorted(_timers.items(), key=lambda item: -item[1][1]):
+        print(f"{name:32s} {calls:8d} {total * 1000:12.2f} {total * 1000 / calls:10.3f}", file=file)
+    if _counters:
+        print(f"{'counter':32s} {'total':>8s}", file=file)
+        for name, total in sorted(_counters.items()):
+            print(f"{name:32s} {total:8d}", file=file)
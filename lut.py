@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+import instrument
+from color import find_closest_batch
+from metrics import get_metric
+from colorspace import rgb_to_lab
+from model import Palette
+
+LUT_VERSION = 3
+# corners bound the extent of a cell only approximately: rgb->lab is not linear, and
+# CIE94/CIEDE2000 do not strictly satisfy the triangle inequality the bound relies on
+RADIUS_SAFETY = 2.0
+# runners-up stored per cell beyond the k answers, so the exact top k can be re-ranked from them
+LUT_EXTRA = 8
+
+def lut_key(palette: Palette, k: int, available_only: bool, bits: int, metric: str) -> str:
+    raw = f"{LUT_VERSION}:{palette.fingerprint}:{k}:{LUT_EXTRA}:{available_only}:{bits}:{metric.upper()}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+class BeadLUT:
+    def __init__(self, palette: Palette, index: np.ndarray, ambiguous: np.ndarray,
+                 k: int, available_only: bool, bits: int, refine: bool = True, metric: str = 'CIE76'):
+        self.palette = palette
+        self.index = index
+        self.ambiguous = ambiguous
+        self.k = k
+        self.available_only = available_only
+        self.bits = bits
+        self.refine = refine
+        self.metric = metric
+
+    def cells_of(self, rgb: np.ndarray) -> np.ndarray:
+        shift = 8 - self.bits
+        q = np.asarray(rgb, dtype=np.uint8).astype(np.intp) >> shift
+        return (q[..., 0] << (2 * self.bits)) | (q[..., 1] << self.bits) | q[..., 2]
+
+    def match(self, rgb) -> tuple[np.ndarray, np.ndarray]:
+        rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+        cells = self.cells_of(rgb)
+        shortlist = self.index[cells].astype(np.intp)
+        with instrument.timer('lab'):
+            labs = rgb_to_lab(rgb)
+        # the exact top k of every cell is among its stored shortlist, so ranking that is enough
+        instrument.count('distance_evaluations', shortlist.size)
+        with instrument.timer('distances'):
+            dist = get_metric(self.metric)(labs[:, None, :], self.palette.lab[shortlist])
+        order = np.lexsort((shortlist, dist), axis=-1)[:, :self.k]
+        idx, dist = np.take_along_axis(shortlist, order, axis=1), np.take_along_axis(dist, order, axis=1)
+        if self.refine:
+            near_edge = self.ambiguous[cells]
+            if near_edge.any():
+                idx[near_edge], dist[near_edge] = find_closest_batch(
+                    self.palette, labs[near_edge], k=self.k, available_only=self.available_only, metric=self.metric)
+        return idx, dist
+
+def build_lut(palette: Palette, k: int, available_only: bool, bits: int,
+              index: np.ndarray, ambiguous: np.ndarray, metric: str = 'CIE76'):
+    width = index.shape[1]
+    levels = 1 << bits
+    step = 1 << (8 - bits)
+    lo = np.arange(levels) * step
+    edges = np.stack([lo, lo + step - 1], axis=1)
+    mid = edges.mean(axis=1)
+    n_candidates = len(palette.candidates(available_only))
+    corner_sel = np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing='ij'), axis=-1).reshape(8, 3)
+    g_mid, b_mid = np.meshgrid(mid, mid, indexing='ij')
+    corners = np.empty((levels, levels, 8, 3))
+    corners[..., 1] = edges[:, corner_sel[:, 1]][:, None, :]
+    corners[..., 2] = edges[:, corner_sel[:, 2]][None, :, :]
+    plane = levels * levels
+    for r in range(levels):
+        centers = np.stack([np.full(plane, mid[r]), g_mid.ravel(), b_mid.ravel()], axis=1)
+        center_lab = rgb_to_lab(centers)
+        idx, dist = find_closest_batch(palette, center_lab, k=min(width + 1, n_candidates),
+                                       available_only=available_only, metric=metric)
+        corners[..., 0] = edges[r, corner_sel[:, 0]]
+        corner_lab = rgb_to_lab(corners.reshape(plane, 8, 3))
+        radius = get_metric(metric)(center_lab[:, None, :], corner_lab).max(axis=1) * RADIUS_SAFETY
+        # a cell needs a full search when a bead outside its shortlist could reach the top k somewhere in it
+        if dist.shape[1] > width:
+            ambiguous[r * plane:(r + 1) * plane] = dist[:, width] - dist[:, k - 1] <= 2 * radius
+        else:
+            ambiguous[r * plane:(r + 1) * plane] = False
+        index[r * plane:(r + 1) * plane] = idx[:, :width]
+
+def _temp_path(directory, suffix: str) -> str:
+    # a name of our own, so processes building the same table at once don't write into one file
+    fd, path = tempfile.mkstemp(dir=directory, suffix=suffix)
+    os.close(fd)
+    return path
+
+def _save_lut(palette: Palette, k: int, available_only: bool, bits: int, metric: str,
+              index_path, ambiguous_path, shape: tuple[int, int]):
+    cache_dir = os.path.dirname(index_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_index_path = _temp_path(cache_dir, '.idx.tmp')
+    tmp_ambiguous_path = _temp_path(cache_dir, '.amb.tmp')
+    try:
+        index = np.lib.format.open_memmap(tmp_index_path, mode='w+', dtype=np.uint16, shape=shape)
+        ambiguous = np.lib.format.open_memmap(tmp_ambiguous_path, mode='w+', dtype=bool, shape=(shape[0],))
+        build_lut(palette, k, available_only, bits, index, ambiguous, metric)
+        index.flush()
+        ambiguous.flush()
+        del index, ambiguous
+        os.replace(tmp_index_path, index_path)
+        os.replace(tmp_ambiguous_path, ambiguous_path)
+    finally:
+        for path in (tmp_index_path, tmp_ambiguous_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _load_saved(index_path, ambiguous_path, shape: tuple[int, int]):
+    try:
+        index = np.load(index_path, mmap_mode='r')
+        ambiguous = np.load(ambiguous_path, mmap_mode='r')
+    except (OSError, ValueError):
+        # a missing, truncated or damaged table is just a miss
+        return None
+    if index.shape != shape or index.dtype != np.uint16 or ambiguous.shape != shape[:1] or ambiguous.dtype != bool:
+        return None
+    return index, ambiguous
+
+def lut_paths(palette: Palette, k: int, available_only: bool, bits: int, cache_dir: str,
+              metric: str) -> tuple[str, str]:
+    k = min(k, len(palette.candidates(available_only)))
+    key = lut_key(palette, k, available_only, bits, metric)
+    return os.path.join(cache_dir, f"lut-{key}.idx.npy"), os.path.join(cache_dir, f"lut-{key}.amb.npy")
+
+def lut_saved(palette: Palette, k: int, available_only: bool, bits: int = 6,
+              cache_dir: str = '.beadify_cache', metric: str = 'CIE76') -> bool:
+    return all(os.path.exists(path) for path in lut_paths(palette, k, available_only, bits, cache_dir, metric))
+
+def load_lut(palette: Palette, k: int, available_only: bool, bits: int = 6,
+             refine: bool = True, cache_dir: str = '.beadify_cache', metric: str = 'CIE76') -> BeadLUT:
+    n_candidates = len(palette.candidates(available_only))
+    k = min(k, n_candidates)
+    width = min(k + LUT_EXTRA, n_candidates)
+    index_path, ambiguous_path = lut_paths(palette, k, available_only, bits, cache_dir, metric)
+    shape = (1 << (3 * bits), width)
+    saved = _load_saved(index_path, ambiguous_path, shape)
+    if saved is None:
+        try:
+            _save_lut(palette, k, available_only, bits, metric, index_path, ambiguous_path, shape)
+            saved = _load_saved(index_path, ambiguous_path, shape)
+        except OSError:
+            pass
+    if saved is None:
+        # an unwritable cache dir builds the table in memory for this run only
+        index = np.empty(shape, dtype=np.uint16)
+        ambiguous = np.empty(shape[0], dtype=bool)
+        build_lut(palette, k, available_only, bits, index, ambiguous, metric)
+        return BeadLUT(palette, index, ambiguous, k, available_only, bits, refine, metric)
+    return BeadLUT(palette, *saved, k, available_only, bits, refine, metric)
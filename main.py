@@ -2,7 +2,30 @@ config = {
     'GUI': True,
     'K': 5,
     'CELL_SIZE': 20,
+    'PEGBOARD_SIZE': 29,
+    'TARGET_WIDTH': None,
+    'TARGET_HEIGHT': None,
+    'TILE': None,
+    'TILE_JOBS': None,
+    'RASTER_THRESHOLD': 10000,
+    'RASTER_VIEWPORT': 800,
+    'RASTER_OVERLAY_MIN_CELL_SIZE': 12,
     'AVAIALABLE_ONLY': True,
+    'METRIC': 'CIEDE2000',
+    'BACKGROUND': 'FFFFFF',
+    'MAX_COLORS': None,
+    'DITHER': None,
+    'DITHER_SERPENTINE': True,
+    'LUT': True,
+    'LUT_BITS': 6,
+    'LUT_REFINE': True,
+    'CACHE_DIR': '.beadify_cache',
+    'MATCH_CACHE': True,
+    'MATCH_CACHE_SIZE': 1 << 16,
+    'MATCH_CACHE_DISK': True,
+    'PROFILE': False,
+    'PROFILE_FORMAT': 'table',
+    'PROFILE_DUMP': None,
 }
 
 class Config:
@@ -12,12 +35,17 @@ class Config:
 config = Config(config)
 
 def main():
-    if config.GUI:
-        import gui
-        gui.main()
-    else:
-        import cli
-        cli.main()
+    import instrument
+    instrument.start()
+    try:
+        if config.GUI:
+            import gui
+            gui.main()
+        else:
+            import cli
+            cli.main()
+    finally:
+        instrument.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+import instrument
+from model import Palette
+
+MATCH_CACHE_VERSION = 3
+# sqlite caps the number of bound parameters per statement
+SQL_BATCH = 500
+
+def cache_key(palette: Palette, k: int, available_only: bool, metric: str, variant: str) -> str:
+    # the palette fingerprint is the CSV's content hash, so editing colors.csv starts a fresh key
+    raw = f"{MATCH_CACHE_VERSION}:{palette.fingerprint}:{k}:{available_only}:{metric.upper()}:{variant}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+def pack(rgb: np.ndarray) -> np.ndarray:
+    rgb = rgb.astype(np.uint32)
+    return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+def locate(sorted_keys: np.ndarray, packed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # which of packed are in sorted_keys, and where
+    if not len(sorted_keys):
+        return np.zeros(len(packed), dtype=bool), np.zeros(len(packed), dtype=np.intp)
+    pos = np.minimum(np.searchsorted(sorted_keys, packed), len(sorted_keys) - 1)
+    return sorted_keys[pos] == packed, pos
+
+# rows are never evicted: the file grows with every distinct color matched under every
+# palette/config key until it is deleted or clear()ed
+class MatchStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # losing the last writes on power failure only costs a recompute
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS matches (key TEXT, rgb INTEGER, idx BLOB, dist BLOB, "
+                          "PRIMARY KEY (key, rgb)) WITHOUT ROWID")
+        self.conn.commit()
+
+    def get(self, key: str, packed: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # the stored colors sorted, with their rows
+        rows = []
+        packed = packed.tolist()
+        with self.lock:
+            try:
+                for start in range(0, len(packed), SQL_BATCH):
+                    batch = packed[start:start + SQL_BATCH]
+                    rows.extend(self.conn.execute(f"SELECT rgb, idx, dist FROM matches WHERE key = ? AND rgb IN "
+                                                  f"({','.join('?' * len(batch))})", [key, *batch]))
+            except sqlite3.Error:
+                # a locked or damaged store degrades to recomputing
+                rows = []
+        if not rows:
+            return np.empty(0, dtype=np.uint32), np.empty((0, k), dtype=np.intp), np.empty((0, k))
+        rgb, idx, dist = zip(*rows)
+        rgb = np.array(rgb, dtype=np.uint32)
+        order = np.argsort(rgb)
+        idx = np.frombuffer(b''.join(idx), dtype='<u2').reshape(len(rows), k)
+        dist = np.frombuffer(b''.join(dist), dtype='<f8').reshape(len(rows), k)
+        return rgb[order], idx[order], dist[order]
+
+    def put(self, key: str, packed: np.ndarray, idx: np.ndarray, dist: np.ndarray):
+        idx = idx.astype('<u2')
+        # full precision, so a disk hit reports the same distance as a fresh match
+        dist = dist.astype('<f8')
+        with self.lock:
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)",
+                                      ((key, value, idx[i].tobytes(), dist[i].tobytes())
+                                       for i, value in enumerate(packed.tolist())))
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM matches")
+            self.conn.commit()
+
+class CachedMatcher:
+    def __init__(self, matcher, palette: Palette, k: int, available_only: bool, metric: str,
+                 capacity: int = 1 << 16, store: MatchStore | None = None, variant: str = 'exact'):
+        self.matcher = matcher
+        self.palette = palette
+        self.k = min(k, len(palette.candidates(available_only)))
+        self.key = cache_key(palette, self.k, available_only, metric, variant)
+        self.capacity = capacity
+        self.store = store
+        # the in-memory level as arrays sorted by packed rgb, so a whole batch is looked up with one searchsorted;
+        # used holds the call count at each entry's last hit, and the lowest are evicted first
+        self.keys = np.empty(0, dtype=np.uint32)
+        self.rows_idx = np.empty((0, self.k), dtype=np.intp)
+        self.rows_dist = np.empty((0, self.k), dtype=np.float64)
+        self.used = np.empty(0, dtype=np.int64)
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def match(self, rgb) -> tuple[np.ndarray, np.ndarray]:
+        rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+        packed = pack(rgb)
+        idx = np.empty((len(packed), self.k), dtype=np.intp)
+        dist = np.empty((len(packed), self.k), dtype=np.float64)
+        with self.lock:
+            self.calls += 1
+            hit, pos = locate(self.keys, packed)
+            idx[hit] = self.rows_idx[pos[hit]]
+            dist[hit] = self.rows_dist[pos[hit]]
+            self.used[pos[hit]] = self.calls
+        missing = np.flatnonzero(~hit)
+        memory_hits = len(packed) - len(missing)
+        fetched = missing
+
+        disk_hits = 0
+        if len(missing) and self.store is not None:
+            found_keys, found_idx, found_dist = self.store.get(self.key, packed[missing], self.k)
+            on_disk, at = locate(found_keys, packed[missing])
+            idx[missing[on_disk]] = found_idx[at[on_disk]]
+            dist[missing[on_disk]] = found_dist[at[on_disk]]
+            disk_hits = int(on_disk.sum())
+            missing = missing[~on_disk]
+
+        if len(missing):
+            computed_idx, computed_dist = self.matcher.match(rgb[missing])
+            idx[missing] = computed_idx
+            dist[missing] = computed_dist
+            if self.store is not None:
+                self.store.put(self.key, packed[missing], computed_idx, computed_dist)
+
+        # disk hits and fresh results both enter the in-memory level
+        with self.lock:
+            self._remember(packed[fetched], idx[fetched], dist[fetched])
+            self.stats['memory_hits'] += memory_hits
+            self.stats['disk_hits'] += disk_hits
+            self.stats['misses'] += len(missing)
+        instrument.count('match_cache.memory_hits', memory_hits)
+        instrument.count('match_cache.disk_hits', disk_hits)
+        instrument.count('match_cache.misses', len(missing))
+        return idx, dist
+
+    def _remember(self, packed: np.ndarray, idx: np.ndarray, dist: np.ndarray):
+        packed, first = np.unique(packed, return_index=True)
+        # another thread may have added some of them meanwhile
+        new = ~locate(self.keys, packed)[0]
+        keys = np.concatenate([self.keys, packed[new]])
+        rows_idx = np.concatenate([self.rows_idx, idx[first[new]]])
+        rows_dist = np.concatenate([self.rows_dist, dist[first[new]]])
+        used = np.concatenate([self.used, np.full(int(new.sum()), self.calls, dtype=np.int64)])
+        # the new keys land at the end, so restore the order locate() depends on
+        keep = np.argsort(keys, kind='stable')
+        if len(keys) > self.capacity:
+            # evict the least recently used, then put the survivors back in key order
+            keep = keep[np.argsort(-used[keep], kind='stable')[:self.capacity]]
+            keep = keep[np.argsort(keys[keep])]
+        self.keys, self.rows_idx, self.rows_dist, self.used = keys[keep], rows_idx[keep], rows_dist[keep], used[keep]
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats['memory_hits'] + self.stats['disk_hits']) / total if total else 0.0
+
+def open_store(cache_dir: str) -> MatchStore | None:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        return MatchStore(os.path.join(cache_dir, 'matches.sqlite'))
+    except (OSError, sqlite3.Error):
+        # an unwritable cache dir just leaves the in-memory level
+        return None
@@ -0,0 +1,44 @@
+import numpy as np
+import color as clr
+import instrument
+from colorspace import rgb_to_lab
+from model import Palette
+from main import config
+
+class DirectMatcher:
+    def __init__(self, palette: Palette, k: int, available_only: bool, metric: str = 'CIE76'):
+        self.palette = palette
+        self.k = k
+        self.available_only = available_only
+        self.metric = metric
+
+    def match(self, rgb) -> tuple[np.ndarray, np.ndarray]:
+        with instrument.timer('lab'):
+            labs = rgb_to_lab(np.asarray(rgb, dtype=np.uint8).reshape(-1, 3))
+        return clr.find_closest_batch(self.palette, labs, k=self.k, available_only=self.available_only,
+                                      metric=self.metric)
+
+# below this many colors to match, a full search costs less than building the lookup table
+LUT_MIN_COLORS = 100_000
+
+def get_matcher(palette: Palette, expected_colors: int | None = None):
+    use_lut = config.LUT
+    if use_lut and expected_colors is not None and expected_colors < LUT_MIN_COLORS:
+        import lut
+        # a table already on disk is free to load, so only a cold build is skipped
+        use_lut = lut.lut_saved(palette, config.K, config.AVAIALABLE_ONLY, bits=config.LUT_BITS,
+                                cache_dir=config.CACHE_DIR, metric=config.METRIC)
+    if use_lut:
+        import lut
+        matcher = lut.load_lut(palette, config.K, config.AVAIALABLE_ONLY, bits=config.LUT_BITS,
+                               refine=config.LUT_REFINE, cache_dir=config.CACHE_DIR, metric=config.METRIC)
+    else:
+        matcher = DirectMatcher(palette, config.K, config.AVAIALABLE_ONLY, config.METRIC)
+    if not config.MATCH_CACHE:
+        return matcher
+    import matchcache
+    # every LUT setup keys its own rows: even a refined LUT may order ties differently from a full search
+    variant = f"lut{config.LUT_BITS}{'r' if config.LUT_REFINE else ''}" if use_lut else 'exact'
+    store = matchcache.open_store(config.CACHE_DIR) if config.MATCH_CACHE_DISK else None
+    return matchcache.CachedMatcher(matcher, palette, config.K, config.AVAIALABLE_ONLY, config.METRIC,
+                                    capacity=config.MATCH_CACHE_SIZE, store=store, variant=variant)
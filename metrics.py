@@ -0,0 +1,132 @@
+from math import atan2, cos, degrees, exp, hypot, pi, radians, sin, sqrt
+import numpy as np
+
+# Every kernel takes Lab arrays shaped (..., 3) and broadcasts them against each other,
+# so (N, 1, 3) targets against (1, P, 3) palette colors gives an (N, P) distance matrix.
+# The first argument is the reference color (the target being matched).
+
+def cie76(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    return np.sqrt(((lab1 - lab2) ** 2).sum(axis=-1))
+
+def cie94(lab1: np.ndarray, lab2: np.ndarray, k_l=1, k_c=1, k_h=1, k_1=0.045, k_2=0.015) -> np.ndarray:
+    # graphic-arts weights by default
+    delta_l = lab1[..., 0] - lab2[..., 0]
+    c1 = np.hypot(lab1[..., 1], lab1[..., 2])
+    c2 = np.hypot(lab2[..., 1], lab2[..., 2])
+    delta_c = c1 - c2
+    delta_h_sq = (lab1[..., 1] - lab2[..., 1]) ** 2 + (lab1[..., 2] - lab2[..., 2]) ** 2 - delta_c ** 2
+    s_c = 1 + k_1 * c1
+    s_h = 1 + k_2 * c1
+    return np.sqrt((delta_l / k_l) ** 2 + (delta_c / (k_c * s_c)) ** 2
+                   + np.maximum(delta_h_sq, 0) / (k_h * s_h) ** 2)
+
+def ciede2000(lab1: np.ndarray, lab2: np.ndarray, k_l=1, k_c=1, k_h=1) -> np.ndarray:
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    c_bar7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    achromatic = c1p * c2p == 0
+
+    delta_lp = l2 - l1
+    delta_cp = c2p - c1p
+    delta_hp = h2p - h1p
+    delta_hp = np.where(delta_hp > 180, delta_hp - 360, np.where(delta_hp < -180, delta_hp + 360, delta_hp))
+    delta_hp = np.where(achromatic, 0, delta_hp)
+    delta_big_hp = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(delta_hp) / 2)
+
+    l_bar = (l1 + l2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(np.abs(h1p - h2p) <= 180, h_sum / 2,
+                     np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    h_bar = np.where(achromatic, h_sum, h_bar)
+
+    t = (1 - 0.17 * np.cos(np.radians(h_bar - 30)) + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6)) - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    delta_theta = 30 * np.exp(-((h_bar - 275) / 25) ** 2)
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2 * np.sqrt(c_bar_p7 / (c_bar_p7 + 25.0 ** 7))
+    s_l = 1 + 0.015 * (l_bar - 50) ** 2 / np.sqrt(20 + (l_bar - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    r_t = -np.sin(np.radians(2 * delta_theta)) * r_c
+
+    term_l = delta_lp / (k_l * s_l)
+    term_c = delta_cp / (k_c * s_c)
+    term_h = delta_big_hp / (k_h * s_h)
+    return np.sqrt(np.maximum(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h, 0))
+
+# Plain-float versions of the kernels for one pair of colors, for loops that cannot be vectorized
+# (error diffusion). A NumPy call costs far more than the arithmetic at that size.
+
+def cie76_point(l1, a1, b1, l2, a2, b2) -> float:
+    return sqrt((l1 - l2) ** 2 + (a1 - a2) ** 2 + (b1 - b2) ** 2)
+
+def cie94_point(l1, a1, b1, l2, a2, b2, k_l=1, k_c=1, k_h=1, k_1=0.045, k_2=0.015) -> float:
+    c1 = hypot(a1, b1)
+    delta_c = c1 - hypot(a2, b2)
+    delta_h_sq = (a1 - a2) ** 2 + (b1 - b2) ** 2 - delta_c ** 2
+    s_c = 1 + k_1 * c1
+    s_h = 1 + k_2 * c1
+    return sqrt(((l1 - l2) / k_l) ** 2 + (delta_c / (k_c * s_c)) ** 2 + max(delta_h_sq, 0) / (k_h * s_h) ** 2)
+
+def ciede2000_point(l1, a1, b1, l2, a2, b2, k_l=1, k_c=1, k_h=1) -> float:
+    c_bar7 = ((hypot(a1, b1) + hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = hypot(a1p, b1), hypot(a2p, b2)
+    h1p = atan2(b1, a1p) % (2 * pi)
+    h2p = atan2(b2, a2p) % (2 * pi)
+    if c1p * c2p == 0:
+        delta_hp = 0.0
+        h_bar = h1p + h2p
+    else:
+        delta_hp = h2p - h1p
+        if delta_hp > pi:
+            delta_hp -= 2 * pi
+        elif delta_hp < -pi:
+            delta_hp += 2 * pi
+        h_bar = (h1p + h2p) / 2
+        if abs(h1p - h2p) > pi:
+            h_bar += pi if h_bar < pi else -pi
+    delta_big_hp = 2 * sqrt(c1p * c2p) * sin(delta_hp / 2)
+
+    l_bar = (l1 + l2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_bar = degrees(h_bar)
+    t = (1 - 0.17 * cos(radians(h_bar - 30)) + 0.24 * cos(radians(2 * h_bar))
+         + 0.32 * cos(radians(3 * h_bar + 6)) - 0.20 * cos(radians(4 * h_bar - 63)))
+    delta_theta = 30 * exp(-((h_bar - 275) / 25) ** 2)
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2 * sqrt(c_bar_p7 / (c_bar_p7 + 25.0 ** 7))
+    s_l = 1 + 0.015 * (l_bar - 50) ** 2 / sqrt(20 + (l_bar - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    r_t = -sin(radians(2 * delta_theta)) * r_c
+
+    term_l = (l2 - l1) / (k_l * s_l)
+    term_c = (c2p - c1p) / (k_c * s_c)
+    term_h = delta_big_hp / (k_h * s_h)
+    return sqrt(max(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h, 0))
+
+METRICS = {
+    'CIE76': cie76,
+    'CIE94': cie94,
+    'CIEDE2000': ciede2000,
+}
+
+POINT_METRICS = {
+    'CIE76': cie76_point,
+    'CIE94': cie94_point,
+    'CIEDE2000': ciede2000_point,
+}
+
+def get_metric(name: str, point=False):
+    try:
+        return (POINT_METRICS if point else METRICS)[name.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown color metric {name!r}, expected one of {', '.join(METRICS)}") from None
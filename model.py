@@ -1,14 +1,15 @@
-from colormath.color_objects import sRGBColor, LabColor
+import numpy as np
 
 class ColorEntry:
+    __slots__ = ('hex', 'coco', 'mard', 'available', 'rgb_tuple', 'lab_color')
+
     def __init__(self, hex_str: str, coco: str, mard: str, available: bool, 
-                 rgb_tuple: tuple[int, int, int], srgb_color: sRGBColor, lab_color: LabColor):
+                 rgb_tuple: tuple[int, int, int], lab_color: np.ndarray):
         self.hex = hex_str.lstrip('#').lower()
         self.coco = coco
         self.mard = mard
         self.available = available
         self.rgb_tuple = rgb_tuple
-        self.srgb_color = srgb_color
         self.lab_color = lab_color
     
     def __eq__(self, __value: object) -> bool:
@@ -20,9 +21,11 @@ class ColorEntry:
         return hash(self.hex.lower())
     
     def __repr__(self):
-        return f"ColorEntry({self.hex}, {self.coco}, {self.mard}, {self.available}, {self.rgb_tuple}, {self.srgb_color}, {self.lab_color})"
+        return f"ColorEntry({self.hex}, {self.coco}, {self.mard}, {self.available}, {self.rgb_tuple}, {tuple(self.lab_color)})"
 
 class ColorEntryMatch:
+    __slots__ = ('color', 'distance')
+
     def __init__(self, color: ColorEntry, distance: float):
         self.color = color
         self.distance = distance
@@ -34,3 +37,35 @@ class ColorEntryMatch:
     
     def __hash__(self) -> int:
         return hash((self.color, self.distance))
+
+class Palette:
+    def __init__(self, hex: np.ndarray, coco: np.ndarray, mard: np.ndarray, available: np.ndarray,
+                 rgb: np.ndarray, lab: np.ndarray, fingerprint: str = ''):
+        self.hex = hex
+        self.coco = coco
+        self.mard = mard
+        self.available = available
+        self.rgb = rgb
+        self.lab = lab
+        self.fingerprint = fingerprint
+        self.all_idx = np.arange(len(hex))
+        self.available_idx = np.flatnonzero(available)
+        self._entries = [None] * len(hex)
+
+    def candidates(self, available_only: bool) -> np.ndarray:
+        return self.available_idx if available_only else self.all_idx
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, i) -> ColorEntry:
+        # entries are only materialized once something asks for them
+        entry = self._entries[i]
+        if entry is None:
+            entry = ColorEntry(str(self.hex[i]), str(self.coco[i]), str(self.mard[i]), bool(self.available[i]),
+                               tuple(int(c) for c in self.rgb[i]), self.lab[i])
+            self._entries[i] = entry
+        return entry
@@ -0,0 +1,67 @@
+import numpy as np
+from color import distance_table, find_closest_batch
+from colorspace import rgb_to_lab
+from fixture import ImageFixture, pack_rgb
+
+# past this many unique colors the histogram is re-binned at 5 bits per channel
+MAX_HISTOGRAM_BINS = 1 << 15
+MAX_SWAP_PASSES = 20
+
+def color_histogram(image_fixture: ImageFixture) -> tuple[np.ndarray, np.ndarray]:
+    weights = np.bincount(image_fixture.index.ravel(), minlength=image_fixture.count).astype(np.float64)
+    lab = rgb_to_lab(image_fixture.src_rgb)
+    if len(lab) <= MAX_HISTOGRAM_BINS:
+        return lab, weights
+    bins, inverse = np.unique(pack_rgb(image_fixture.src_rgb >> 3), return_inverse=True)
+    binned_weights = np.bincount(inverse, weights=weights, minlength=len(bins))
+    binned_lab = np.stack([np.bincount(inverse, weights=weights * lab[:, c], minlength=len(bins))
+                           for c in range(3)], axis=1) / binned_weights[:, None]
+    return binned_lab, binned_weights
+
+def select_beads(distances: np.ndarray, weights: np.ndarray, n: int) -> np.ndarray:
+    # weighted k-medoids over the (colors x beads) distance matrix: greedy build, then swaps
+    chosen = []
+    nearest = np.full(len(weights), np.inf)
+    for _ in range(n):
+        costs = (weights[:, None] * np.minimum(nearest[:, None], distances)).sum(axis=0)
+        costs[chosen] = np.inf
+        best = int(costs.argmin())
+        chosen.append(best)
+        nearest = np.minimum(nearest, distances[:, best])
+    chosen = np.array(chosen)
+    cost = (weights * nearest).sum()
+    for _ in range(MAX_SWAP_PASSES):
+        improved = False
+        for slot in range(n):
+            sub = distances[:, chosen]
+            order = np.argsort(sub, axis=1)[:, :2]
+            first = np.take_along_axis(sub, order[:, :1], axis=1)[:, 0]
+            second = np.take_along_axis(sub, order[:, 1:2], axis=1)[:, 0] if n > 1 else np.full(len(weights), np.inf)
+            # distance each color falls back to once this slot's bead is removed
+            base = np.where(order[:, 0] == slot, second, first)
+            costs = (weights[:, None] * np.minimum(base[:, None], distances)).sum(axis=0)
+            costs[chosen] = np.inf
+            best = int(costs.argmin())
+            if costs[best] < cost - 1e-9 * max(cost, 1):
+                chosen[slot] = best
+                cost = costs[best]
+                improved = True
+        if not improved:
+            break
+    return chosen
+
+def select_palette(image_fixture: ImageFixture, n: int, available_only=False, metric='CIE76') -> np.ndarray:
+    palette = image_fixture.palette
+    candidates = palette.candidates(available_only)
+    if n >= len(candidates):
+        return candidates
+    lab, weights = color_histogram(image_fixture)
+    distances = distance_table(palette, lab, candidates, metric)
+    return np.sort(candidates[select_beads(distances, weights, n)])
+
+def remap_to_subset(image_fixture: ImageFixture, subset: np.ndarray, metric='CIE76') -> ImageFixture:
+    k = image_fixture.match_idx.shape[1]
+    match_idx, match_dist = find_closest_batch(image_fixture.palette, rgb_to_lab(image_fixture.src_rgb), k=k,
+                                               candidates=subset, metric=metric)
+    return ImageFixture(image_fixture.palette, image_fixture.src_rgb, image_fixture.index,
+                        match_idx.astype(image_fixture.match_idx.dtype), match_dist.astype(np.float32))
@@ -1,16 +1,76 @@
 import csv
-from color import hex_to_lab, hex_to_rgb, hex_to_srgb
-from model import ColorEntry
-
-def prepare_repository(csv_file_path) -> list[ColorEntry]:
-    repository = []
-    with open(csv_file_path, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            repository.append(_row_to_colorentry(row))
-    return repository
-
-def _row_to_colorentry(row) -> ColorEntry:
-    hex_str, coco, mard, available = row['hex'].lstrip('#'), row['coco'], row['mard'], row['available'].lower() == 'true'
-    rgb_tuple, srgb_color, lab_color = hex_to_rgb(hex_str), hex_to_srgb(hex_str), hex_to_lab(hex_str)
-    return ColorEntry(hex_str, coco, mard, available, rgb_tuple, srgb_color, lab_color)
+import hashlib
+import io
+import os
+import zipfile
+import numpy as np
+import instrument
+from color import hexes_to_rgb
+from colorspace import rgb_to_lab
+from model import Palette
+
+COMPILED_VERSION = 1
+_COLUMNS = ('hex', 'coco', 'mard', 'available', 'rgb', 'lab')
+
+def prepare_repository(csv_file_path) -> Palette:
+    with instrument.timer('palette.load'):
+        palette = _prepare_repository(csv_file_path)
+    instrument.count('palette.colors', len(palette))
+    return palette
+
+def _prepare_repository(csv_file_path) -> Palette:
+    compiled_path = compiled_path_for(csv_file_path)
+    stat = os.stat(csv_file_path)
+    compiled = _load_compiled(compiled_path)
+    if compiled is not None and compiled['mtime_ns'] == stat.st_mtime_ns and compiled['size'] == stat.st_size:
+        return _compiled_to_palette(compiled)
+    with open(csv_file_path, 'rb') as csvfile:
+        data = csvfile.read()
+    fingerprint = hashlib.sha256(data).hexdigest()
+    if compiled is not None and compiled['fingerprint'] == fingerprint:
+        palette = _compiled_to_palette(compiled)
+    else:
+        with instrument.timer('palette.compile'):
+            palette = _compile_csv(data, fingerprint)
+    _save_compiled(compiled_path, palette, stat)
+    return palette
+
+def compiled_path_for(csv_file_path) -> str:
+    return os.path.splitext(csv_file_path)[0] + '.palette.npz'
+
+def _compile_csv(data: bytes, fingerprint: str) -> Palette:
+    rows = list(csv.DictReader(io.StringIO(data.decode('utf-8'), newline='')))
+    hex_strs = np.array([row['hex'].lstrip('#').lower() for row in rows], dtype='<U6')
+    coco = np.array([row['coco'] for row in rows], dtype=str)
+    mard = np.array([row['mard'] for row in rows], dtype=str)
+    available = np.array([row['available'].lower() == 'true' for row in rows], dtype=bool)
+    rgb = hexes_to_rgb(hex_strs)
+    return Palette(hex_strs, coco, mard, available, rgb, rgb_to_lab(rgb), fingerprint)
+
+def _compiled_to_palette(compiled: dict) -> Palette:
+    return Palette(*(compiled[column] for column in _COLUMNS), fingerprint=compiled['fingerprint'])
+
+def _load_compiled(compiled_path) -> dict | None:
+    try:
+        with np.load(compiled_path, allow_pickle=False) as npz:
+            compiled = {name: npz[name] for name in ('version', 'mtime_ns', 'size', 'fingerprint', *_COLUMNS)}
+    except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+        # a truncated or damaged cache file is just a miss
+        return None
+    if compiled.get('version') != COMPILED_VERSION:
+        return None
+    for name in ('version', 'mtime_ns', 'size'):
+        compiled[name] = int(compiled[name])
+    compiled['fingerprint'] = str(compiled['fingerprint'])
+    return compiled
+
+def _save_compiled(compiled_path, palette: Palette, stat: os.stat_result):
+    tmp_path = compiled_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=COMPILED_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size,
+                     fingerprint=palette.fingerprint, **{column: getattr(palette, column) for column in _COLUMNS})
+        os.replace(tmp_path, compiled_path)
+    except OSError:
+        # a read-only checkout just recompiles on every start
+        pass
@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+import numpy as np
+import pytest
+from cli import read_hex_values, stream
+
+class StubMatcher:
+    # always answers beads 0 and 1, at distances that encode the input's red channel
+    def __init__(self):
+        self.calls = []
+
+    def match(self, rgb):
+        self.calls.append(len(rgb))
+        idx = np.tile([0, 1], (len(rgb), 1))
+        return idx, np.stack([rgb[:, 0], rgb[:, 0] + 1], axis=1).astype(np.float64)
+
+@pytest.mark.parametrize('text, column, expected', [
+    ('ff0000\n#00ff00\n\n0000FF\n', None, ['ff0000', '#00ff00', '0000FF']),
+    ('name,hex\nred,ff0000\ngreen, 00ff00\n', None, ['ff0000', '00ff00']),
+    ('ff0000,x\n00ff00,y\n', None, ['ff0000', '00ff00']),
+    ('a,Color\n1,ff0000\n2\n', 'color', ['ff0000', '']),
+])
+def test_read_hex_values(text, column, expected):
+    assert list(read_hex_values(io.StringIO(text), column)) == expected
+
+def test_read_hex_values_missing_column():
+    with pytest.raises(ValueError):
+        list(read_hex_values(io.StringIO('a,b\n1,2\n'), 'hex'))
+
+def test_stream_ndjson(palette):
+    matcher, out = StubMatcher(), io.StringIO()
+    stream(palette, matcher, io.StringIO('hex\n0a0000\nnope\n140000\n1e0000\n'), out, batch_size=2)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [record['input'] for record in records] == ['0a0000', 'nope', '140000', '1e0000']
+    assert records[1] == {'input': 'nope', 'error': 'invalid hex color'}
+    assert [record['matches'][0]['distance'] for record in (records[0], records[2], records[3])] == [10, 20, 30]
+    assert records[0]['matches'][1]['hex'] == palette.hex[1]
+    # the invalid row is dropped from its batch before matching
+    assert matcher.calls == [1, 2]
+
+def test_stream_csv(palette):
+    out = io.StringIO()
+    stream(palette, StubMatcher(), io.StringIO('0a0000\nzz\n'), out, output_format='csv')
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [(row['input'], row['rank'], row['error']) for row in rows] == [
+        ('0a0000', '1', ''), ('0a0000', '2', ''), ('zz', '', 'invalid hex color')]
+    assert rows[1]['coco'] == palette.coco[1]
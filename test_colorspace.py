@@ -0,0 +1,25 @@
+import numpy as np
+from colorspace import rgb_to_lab
+
+# sRGB (D65, 2 degree observer) -> Lab as computed by colormath 3.0.0
+REFERENCE_LAB = [
+    ((0, 0, 0), (0.0, 0.0, 0.0)),
+    ((255, 255, 255), (99.99998453333127, -0.0004593894083471106, -0.008561457924405325)),
+    ((255, 0, 0), (53.23896002513146, 80.09045298802708, 67.2013836595967)),
+    ((0, 255, 0), (87.73500278716472, -86.1829494051608, 83.1795364492565)),
+    ((0, 0, 255), (32.299375201436156, 79.1913962872024, -107.86546414496824)),
+    ((128, 128, 128), (53.585004174166016, -0.0002755742944948736, -0.005135768662412055)),
+    ((18, 52, 86), (21.042135383139815, 1.0561613155631033, -24.104650549252526)),
+    ((250, 128, 114), (67.26310818061904, 45.22376362899821, 29.088399495301797)),
+    # inside the linear segment of both the sRGB curve and the Lab f(t)
+    ((1, 2, 3), (0.509833512052932, -0.12241231401730057, -0.47076345243975415)),
+]
+
+def test_rgb_to_lab_matches_colormath():
+    rgb = np.array([rgb for rgb, _ in REFERENCE_LAB], dtype=np.uint8)
+    expected = np.array([lab for _, lab in REFERENCE_LAB])
+    np.testing.assert_allclose(rgb_to_lab(rgb), expected, rtol=0, atol=1e-9)
+
+def test_rgb_to_lab_float_input_matches_table_lookup():
+    rgb = np.array([rgb for rgb, _ in REFERENCE_LAB], dtype=np.uint8)
+    np.testing.assert_allclose(rgb_to_lab(rgb.astype(np.float64)), rgb_to_lab(rgb), rtol=0, atol=1e-12)
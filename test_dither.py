@@ -0,0 +1,14 @@
+import numpy as np
+from color import find_closest_batch
+from dither import load_grid
+
+def test_grid_nearest_matches_full_search_and_survives_disk(palette, tmp_path):
+    candidates = palette.candidates(True)
+    lab = np.random.default_rng(0).uniform([0, -80, -100], [100, 90, 90], (2000, 3))
+    built = load_grid(palette, candidates, 'CIE76', str(tmp_path))
+    loaded = load_grid(palette, candidates, 'CIE76', str(tmp_path))
+    for name, array in built.arrays.items():
+        np.testing.assert_array_equal(loaded.arrays[name], array)
+    _, expected = find_closest_batch(palette, lab, k=1, candidates=candidates)
+    got = np.array([loaded.nearest(*point) for point in lab.tolist()])
+    np.testing.assert_allclose(np.linalg.norm(palette.lab[got] - lab, axis=1), expected[:, 0], rtol=0, atol=1e-9)
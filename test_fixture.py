@@ -0,0 +1,32 @@
+import numpy as np
+from PIL import Image
+from fixture import read_rgb, read_src_rgb
+from main import config
+
+def test_alpha_is_composited_over_background():
+    image = Image.fromarray(np.array([[[200, 100, 0, 128], [10, 20, 30, 255], [10, 20, 30, 0]]], dtype=np.uint8))
+    rgb = read_rgb(image, background=(0, 0, 255))
+    # (c * a + bg * (255 - a) + 127) // 255, rounded to nearest
+    np.testing.assert_array_equal(rgb, [[[100, 50, 127], [10, 20, 30], [0, 0, 255]]])
+    assert rgb.dtype == np.uint8
+
+def test_paletted_image_with_transparent_index():
+    image = Image.new('P', (2, 1))
+    image.putpalette([255, 0, 0, 0, 255, 0])
+    image.putdata([0, 1])
+    image.info['transparency'] = 1
+    np.testing.assert_array_equal(read_rgb(image, background=(1, 2, 3)), [[[255, 0, 0], [1, 2, 3]]])
+
+def test_grayscale_modes():
+    np.testing.assert_array_equal(read_rgb(Image.fromarray(np.array([[7, 250]], dtype=np.uint8), 'L')),
+                                  [[[7, 7, 7], [250, 250, 250]]])
+    la = Image.fromarray(np.array([[[100, 255], [100, 0]]], dtype=np.uint8), 'LA')
+    np.testing.assert_array_equal(read_rgb(la, background=(9, 9, 9)), [[[100, 100, 100], [9, 9, 9]]])
+
+def test_read_src_rgb_uses_configured_background(tmp_path, monkeypatch):
+    path = tmp_path / 'clear.png'
+    Image.new('RGBA', (2, 2), (0, 0, 0, 0)).save(path)
+    monkeypatch.setattr(config, 'BACKGROUND', '102030')
+    monkeypatch.setattr(config, 'TARGET_WIDTH', None)
+    monkeypatch.setattr(config, 'TARGET_HEIGHT', None)
+    np.testing.assert_array_equal(read_src_rgb(path), np.full((2, 2, 3), [16, 32, 48]))
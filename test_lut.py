@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from color import find_closest_batch
+from colorspace import rgb_to_lab
+from lut import BeadLUT, load_lut
+from main import config
+from matcher import DirectMatcher, get_matcher
+
+@pytest.mark.parametrize('metric', ['CIE76', 'CIE94', 'CIEDE2000'])
+@pytest.mark.parametrize('bits', [4, 5])
+def test_lut_top_k_matches_full_search(palette, tmp_path, metric, bits):
+    rgb = np.random.default_rng(bits).integers(0, 256, (5000, 3), dtype=np.uint8)
+    lut = load_lut(palette, 5, True, bits=bits, cache_dir=str(tmp_path), metric=metric)
+    _, dist = lut.match(rgb)
+    _, expected = find_closest_batch(palette, rgb_to_lab(rgb), k=5, available_only=True, metric=metric)
+    # compared by distance: beads with identical colors may come back in either order
+    np.testing.assert_allclose(dist, expected, rtol=0, atol=1e-9)
+
+def test_unwritable_cache_dir_builds_in_memory(palette, tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    rgb = np.random.default_rng(0).integers(0, 256, (100, 3), dtype=np.uint8)
+    lut = load_lut(palette, 5, True, bits=4, cache_dir=str(blocker / 'cache'))
+    _, expected = find_closest_batch(palette, rgb_to_lab(rgb), k=5, available_only=True)
+    np.testing.assert_allclose(lut.match(rgb)[1], expected, rtol=0, atol=1e-9)
+
+def test_damaged_cache_is_rebuilt(palette, tmp_path):
+    rgb = np.random.default_rng(1).integers(0, 256, (100, 3), dtype=np.uint8)
+    expected = load_lut(palette, 5, True, bits=4, cache_dir=str(tmp_path)).match(rgb)[1]
+    (index_path,) = tmp_path.glob('lut-*.idx.npy')
+    index_path.write_bytes(index_path.read_bytes()[:index_path.stat().st_size // 2])
+    np.testing.assert_array_equal(load_lut(palette, 5, True, bits=4, cache_dir=str(tmp_path)).match(rgb)[1], expected)
+    assert sorted(path.name.split('.', 1)[1] for path in tmp_path.iterdir()) == ['amb.npy', 'idx.npy']
+
+def test_few_colors_skip_a_cold_build(palette, tmp_path, monkeypatch):
+    for name, value in (('CACHE_DIR', str(tmp_path)), ('LUT', True), ('LUT_BITS', 4), ('METRIC', 'CIE76'),
+                        ('MATCH_CACHE', False)):
+        monkeypatch.setattr(config, name, value)
+    assert isinstance(get_matcher(palette, expected_colors=10), DirectMatcher)
+    assert isinstance(get_matcher(palette), BeadLUT)
+    assert isinstance(get_matcher(palette, expected_colors=10), BeadLUT)
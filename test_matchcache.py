@@ -0,0 +1,73 @@
+import numpy as np
+from matcher import DirectMatcher
+from matchcache import CachedMatcher, MatchStore
+
+class CountingMatcher:
+    def __init__(self, palette):
+        self.inner = DirectMatcher(palette, 5, True)
+        self.computed = 0
+
+    def match(self, rgb):
+        self.computed += len(rgb)
+        return self.inner.match(rgb)
+
+def colors(seed, n):
+    # distinct colors spread over the whole cube, so batches interleave in packed order
+    rng = np.random.default_rng(seed)
+    return np.unique(rng.integers(0, 256, (n, 3), dtype=np.uint8), axis=0)
+
+def test_interleaved_batches_hit(palette):
+    inner = CountingMatcher(palette)
+    cached = CachedMatcher(inner, palette, 5, True, 'CIE76')
+    cached.match([[200, 0, 0], [210, 0, 0]])
+    cached.match([[10, 0, 0], [20, 0, 0]])
+    assert np.all(np.diff(cached.keys.astype(np.int64)) > 0)
+    cached.match([[10, 0, 0], [20, 0, 0], [200, 0, 0], [210, 0, 0]])
+    assert inner.computed == 4
+
+def test_overlapping_batches_match_uncached(palette):
+    pool = colors(0, 2000)
+    rng = np.random.default_rng(1)
+    inner = CountingMatcher(palette)
+    cached = CachedMatcher(inner, palette, 5, True, 'CIE76')
+    for _ in range(10):
+        batch = pool[rng.choice(len(pool), 800, replace=False)]
+        idx, dist = cached.match(batch)
+        expected_idx, expected_dist = inner.inner.match(batch)
+        np.testing.assert_array_equal(idx, expected_idx)
+        np.testing.assert_array_equal(dist, expected_dist)
+    # every distinct color is computed exactly once
+    assert inner.computed == len(cached.keys)
+    assert len(np.unique(cached.keys)) == len(cached.keys)
+
+def test_evicts_least_recently_used(palette):
+    inner = CountingMatcher(palette)
+    cached = CachedMatcher(inner, palette, 5, True, 'CIE76', capacity=4)
+    old, recent, fresh = colors(2, 2), colors(3, 2), colors(4, 2)
+    cached.match(old)
+    cached.match(recent)
+    cached.match(fresh)
+    assert len(cached.keys) == 4
+    assert np.all(np.diff(cached.keys.astype(np.int64)) > 0)
+    computed = inner.computed
+    cached.match(np.concatenate([recent, fresh]))
+    assert inner.computed == computed
+    cached.match(old)
+    assert inner.computed == computed + len(old)
+
+def test_disk_round_trip(palette, tmp_path):
+    rgb = colors(5, 300)
+    path = str(tmp_path / 'matches.sqlite')
+    first = CachedMatcher(CountingMatcher(palette), palette, 5, True, 'CIE76', store=MatchStore(path))
+    idx, dist = first.match(rgb)
+    first.store.conn.close()
+
+    inner = CountingMatcher(palette)
+    second = CachedMatcher(inner, palette, 5, True, 'CIE76', store=MatchStore(path))
+    disk_idx, disk_dist = second.match(rgb)
+    assert inner.computed == 0
+    assert second.stats['disk_hits'] == len(rgb)
+    np.testing.assert_array_equal(disk_idx, idx)
+    # the same distances whichever level answers
+    np.testing.assert_array_equal(disk_dist, dist)
+    second.store.conn.close()
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from metrics import cie76, cie94, ciede2000, ciede2000_point, get_metric, METRICS, POINT_METRICS
+
+# Sharma, Wu & Dalal (2005), "The CIEDE2000 color-difference formula", table 1
+SHARMA_PAIRS = [
+    ((50.0000, 2.6772, -79.7751), (50.0000, 0.0000, -82.7485), 2.0425),
+    ((50.0000, 3.1571, -77.2803), (50.0000, 0.0000, -82.7485), 2.8615),
+    ((50.0000, 2.8361, -74.0200), (50.0000, 0.0000, -82.7485), 3.4412),
+    ((50.0000, -1.3802, -84.2814), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -1.1848, -84.8006), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -0.9009, -85.5211), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, 0.0000, 0.0000), (50.0000, -1.0000, 2.0000), 2.3669),
+    ((50.0000, -1.0000, 2.0000), (50.0000, 0.0000, 0.0000), 2.3669),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0009), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0010), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0011), 7.2195),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0012), 7.2195),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0009, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0010, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0011, -2.4900), 4.7461),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 0.0000, -2.5000), 4.3065),
+    ((50.0000, 2.5000, 0.0000), (73.0000, 25.0000, -18.0000), 27.1492),
+    ((50.0000, 2.5000, 0.0000), (61.0000, -5.0000, 29.0000), 22.8977),
+    ((50.0000, 2.5000, 0.0000), (56.0000, -27.0000, -3.0000), 31.9030),
+    ((50.0000, 2.5000, 0.0000), (58.0000, 24.0000, 15.0000), 19.4535),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.1736, 0.5854), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2972, 0.0000), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 1.8634, 0.5757), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2592, 0.3350), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((61.2901, 3.7196, -5.3901), (61.4292, 2.2480, -4.9620), 1.8731),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8645),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((36.4612, 47.8580, 18.3852), (36.2715, 50.5065, 21.2231), 1.4146),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4441),
+    ((90.9257, -0.5406, -0.9208), (88.6381, -0.8985, -0.7239), 1.5381),
+    ((6.7747, -0.2908, -2.4247), (5.8714, -0.0985, -2.2286), 0.6377),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+# colormath 3.0.0 delta_e_cie1994 with its graphic-arts defaults; CIE94 is not symmetric
+CIE94_REFERENCE = [
+    ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 34.68916319804271),
+    ((73.0, 25.0, -18.0), (50.0, 2.5, 0.0), 26.139751644518924),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.3909947094745128),
+    ((60.4626, -34.1751, 39.4387), (60.2574, -34.0099, 36.2677), 1.3576187100641364),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4194526106557426),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8204508827518613),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.23606797749979),
+    ((50.0, -1.0, 2.0), (50.0, 0.0, 0.0), 2.0316383154436566),
+]
+
+def _columns(pairs):
+    return (np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs]), np.array([p[2] for p in pairs]))
+
+def test_ciede2000_sharma_pairs():
+    lab1, lab2, expected = _columns(SHARMA_PAIRS)
+    np.testing.assert_allclose(ciede2000(lab1, lab2), expected, rtol=0, atol=1e-4)
+
+def test_ciede2000_is_symmetric():
+    lab1, lab2, expected = _columns(SHARMA_PAIRS)
+    np.testing.assert_allclose(ciede2000(lab2, lab1), expected, rtol=0, atol=1e-4)
+
+def test_cie94_reference_values():
+    lab1, lab2, expected = _columns(CIE94_REFERENCE)
+    np.testing.assert_allclose(cie94(lab1, lab2), expected, rtol=0, atol=1e-9)
+
+def test_cie76_is_euclidean():
+    assert cie76(np.array([50.0, 0.0, 0.0]), np.array([53.0, 4.0, 0.0])) == pytest.approx(5.0)
+
+def test_kernels_broadcast_to_distance_matrix():
+    lab1, lab2, expected = _columns(SHARMA_PAIRS)
+    matrix = ciede2000(lab1[:, None, :], lab2[None, :, :])
+    assert matrix.shape == (len(lab1), len(lab2))
+    np.testing.assert_allclose(np.diagonal(matrix), expected, rtol=0, atol=1e-4)
+
+@pytest.mark.parametrize('name', list(METRICS))
+def test_point_kernels_match_vector_kernels(name):
+    rng = np.random.default_rng(0)
+    lab = np.column_stack([rng.uniform(0, 100, 2000), rng.uniform(-90, 100, 2000), rng.uniform(-110, 95, 2000)])
+    lab1, lab2 = lab[:1000], lab[1000:]
+    points = [POINT_METRICS[name](*p1, *p2) for p1, p2 in zip(lab1.tolist(), lab2.tolist())]
+    np.testing.assert_allclose(points, METRICS[name](lab1, lab2), rtol=0, atol=1e-9)
+
+def test_ciede2000_point_sharma_pairs():
+    for lab1, lab2, expected in SHARMA_PAIRS:
+        assert ciede2000_point(*lab1, *lab2) == pytest.approx(expected, abs=1e-4)
+
+def test_get_metric():
+    assert get_metric('ciede2000') is ciede2000
+    assert get_metric('ciede2000', point=True) is ciede2000_point
+    with pytest.raises(ValueError):
+        get_metric('cmc')
@@ -0,0 +1,40 @@
+from itertools import combinations
+import numpy as np
+import pytest
+import reduction
+from fixture import match_rgb
+from matcher import DirectMatcher
+
+def cost(distances, weights, chosen):
+    return (weights * distances[:, list(chosen)].min(axis=1)).sum()
+
+@pytest.fixture
+def histogram():
+    rng = np.random.default_rng(0)
+    colors, beads = rng.uniform(0, 100, (40, 3)), rng.uniform(0, 100, (12, 3))
+    distances = np.linalg.norm(colors[:, None, :] - beads[None, :, :], axis=2)
+    return distances, rng.integers(1, 50, len(colors)).astype(np.float64)
+
+@pytest.mark.parametrize('n', [1, 2, 3])
+def test_select_beads_matches_brute_force(histogram, n):
+    distances, weights = histogram
+    best = min(cost(distances, weights, chosen) for chosen in combinations(range(distances.shape[1]), n))
+    chosen = reduction.select_beads(distances, weights, n)
+    assert len(set(chosen.tolist())) == n
+    assert cost(distances, weights, chosen) == pytest.approx(best)
+
+def test_swaps_never_cost_more_than_greedy_build(histogram, monkeypatch):
+    distances, weights = histogram
+    swapped = reduction.select_beads(distances, weights, 5)
+    monkeypatch.setattr(reduction, 'MAX_SWAP_PASSES', 0)
+    greedy = reduction.select_beads(distances, weights, 5)
+    assert cost(distances, weights, swapped) <= cost(distances, weights, greedy)
+
+def test_remap_to_subset_stays_in_subset(palette):
+    rgb = np.random.default_rng(1).integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    image_fixture = match_rgb(palette, rgb, DirectMatcher(palette, 5, True))
+    subset = reduction.select_palette(image_fixture, 8, available_only=True)
+    remapped = reduction.remap_to_subset(image_fixture, subset)
+    assert len(subset) == 8
+    assert np.isin(remapped.match_idx, subset).all()
+    np.testing.assert_array_equal(remapped.index, image_fixture.index)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import repo
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'colors.csv'
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'colors.csv'), path)
+    return path
+
+def compile_calls(monkeypatch) -> list:
+    calls = []
+    compile_csv = repo._compile_csv
+
+    def counting(*args):
+        calls.append(args)
+        return compile_csv(*args)
+    monkeypatch.setattr(repo, '_compile_csv', counting)
+    return calls
+
+def test_unchanged_csv_reuses_compiled(csv_path, monkeypatch):
+    first = repo.prepare_repository(csv_path)
+    calls = compile_calls(monkeypatch)
+    again = repo.prepare_repository(csv_path)
+    # a touch changes the mtime but not the content hash
+    os.utime(csv_path, ns=(0, os.stat(csv_path).st_mtime_ns + 10 ** 9))
+    touched = repo.prepare_repository(csv_path)
+    assert calls == []
+    for palette in (again, touched):
+        np.testing.assert_array_equal(palette.lab, first.lab)
+        assert palette.fingerprint == first.fingerprint
+
+def test_changed_csv_recompiles(csv_path, monkeypatch):
+    first = repo.prepare_repository(csv_path)
+    calls = compile_calls(monkeypatch)
+    stat = os.stat(csv_path)
+    lines = csv_path.read_text().splitlines(keepends=True)
+    csv_path.write_text(''.join(lines[:-1]))
+    # same mtime, so only the size and content give the change away
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    changed = repo.prepare_repository(csv_path)
+    assert len(calls) == 1
+    assert len(changed) == len(first) - 1
+    assert changed.fingerprint != first.fingerprint
+
+def test_truncated_compiled_file_falls_back_to_csv(csv_path, monkeypatch):
+    first = repo.prepare_repository(csv_path)
+    compiled = repo.compiled_path_for(str(csv_path))
+    with open(compiled, 'r+b') as f:
+        f.truncate(os.path.getsize(compiled) // 2)
+    calls = compile_calls(monkeypatch)
+    palette = repo.prepare_repository(csv_path)
+    assert len(calls) == 1
+    np.testing.assert_array_equal(palette.lab, first.lab)
+    # and the damaged file was replaced
+    calls.clear()
+    repo.prepare_repository(csv_path)
+    assert calls == []
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from colorspace import linear_to_srgb, srgb_to_linear
+from export import board_tiles, bead_counts, bom_rows
+from fixture import ImageFixture, ColorMapChoice, build_fixture, match_rgb, read_src_rgb
+from matcher import get_matcher
+from model import Palette
+from main import config
+
+class Tile:
+    def __init__(self, row: int, col: int, y0: int, x0: int, image_fixture: ImageFixture):
+        self.row = row
+        self.col = col
+        self.y0 = y0
+        self.x0 = x0
+        self.image_fixture = image_fixture
+
+    @property
+    def name(self) -> str:
+        return f"r{self.row + 1:02d}c{self.col + 1:02d}"
+
+def target_size(height: int, width: int, target_width=None, target_height=None) -> tuple[int, int]:
+    # a missing side follows the source aspect ratio
+    if target_width and target_height:
+        return target_height, target_width
+    if target_width:
+        return max(round(height * target_width / width), 1), target_width
+    if target_height:
+        return target_height, max(round(width * target_height / height), 1)
+    return height, width
+
+def resample(rgb: np.ndarray, target_width=None, target_height=None) -> np.ndarray:
+    height, width = target_size(*rgb.shape[:2], target_width, target_height)
+    if (height, width) == rgb.shape[:2]:
+        return rgb
+    # box filter = area average; done on linear light so dark/bright mixes don't come out too dark
+    linear = srgb_to_linear(rgb / 255).astype(np.float32)
+    channels = [np.asarray(Image.fromarray(linear[..., c], 'F').resize((width, height), Image.Resampling.BOX))
+                for c in range(3)]
+    srgb = linear_to_srgb(np.clip(np.stack(channels, axis=-1), 0, 1))
+    return np.rint(srgb * 255).astype(np.uint8)
+
+def _shared_candidates(palette: Palette, rgb: np.ndarray, matcher):
+    # tiles must agree on one reduced bead set, so it is picked from the whole mural
+    if not config.MAX_COLORS:
+        return None
+    import reduction
+    return reduction.select_palette(match_rgb(palette, rgb, matcher), config.MAX_COLORS,
+                                    config.AVAIALABLE_ONLY, config.METRIC)
+
+def split_tiles(palette: Palette, rgb: np.ndarray, board_size: int, matcher=None, jobs=None) -> list[Tile]:
+    matcher = matcher or get_matcher(palette)
+    jobs = jobs or config.TILE_JOBS or 1
+    candidates = _shared_candidates(palette, rgb, matcher)
+    bounds = board_tiles(*rgb.shape[:2], board_size)
+
+    def build(bound):
+        y0, x0, y1, x1 = bound
+        return Tile(y0 // board_size, x0 // board_size, y0, x0,
+                    build_fixture(palette, rgb[y0:y1, x0:x1], matcher, candidates))
+
+    if jobs > 1:
+        # matching and reduction spend their time in numpy, which releases the GIL. The DITHER scan is pure
+        # Python and holds it, so dithering still runs one tile at a time; only the other stages overlap
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(build, bounds))
+    return [build(bound) for bound in bounds]
+
+def load_tiles(palette: Palette, src_img_path, board_size: int, matcher=None, jobs=None) -> list[Tile]:
+    return split_tiles(palette, read_src_rgb(src_img_path), board_size, matcher, jobs)
+
+def load_tile(palette: Palette, src_img_path, board_size: int, row: int, col: int, matcher=None,
+              progress=None) -> ImageFixture:
+    rgb = read_src_rgb(src_img_path)
+    rows, cols = -(-rgb.shape[0] // board_size), -(-rgb.shape[1] // board_size)
+    if not (0 <= row < rows and 0 <= col < cols):
+        raise ValueError(f"Tile ({row + 1}, {col + 1}) is outside the {rows}x{cols} board layout")
+    matcher = matcher or get_matcher(palette)
+    candidates = _shared_candidates(palette, rgb, matcher)
+    y0, x0 = row * board_size, col * board_size
+    return build_fixture(palette, rgb[y0:y0 + board_size, x0:x0 + board_size], matcher, candidates, progress)
+
+def tile_counts(tiles: list[Tile]) -> list[np.ndarray]:
+    return [bead_counts(tile.image_fixture, ColorMapChoice(tile.image_fixture)) for tile in tiles]
+
+def tile_bills_of_materials(tiles: list[Tile]) -> tuple[list[dict], list[dict]]:
+    counts = tile_counts(tiles)
+    palette = tiles[0].image_fixture.palette
+    per_tile = [{'tile': tile.name, 'row': tile.row + 1, 'col': tile.col + 1,
+                 'width': tile.image_fixture.width, 'height': tile.image_fixture.height,
+                 'bom': bom_rows(palette, tile_count)} for tile, tile_count in zip(tiles, counts)]
+    return per_tile, bom_rows(palette, np.sum(counts, axis=0))